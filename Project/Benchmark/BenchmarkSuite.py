@@ -0,0 +1,142 @@
+import glob
+import json
+import os
+import platform
+import statistics
+import time
+import numpy as np
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from ..FeatureExtraction import FeatureID, FeatureStatistics, HistoryHandler
+from ..Inference.Evaluation import Evaluation
+from ..Inference.Inference import Inference
+from ..Train.Optimizer import Optimizer
+
+# The baseline results kept with the package (see BenchmarkSuite.compare)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class BenchmarkSuite:
+    """
+    Times the hot paths of the tagger over the tagged files of the data directory: FeatureStatistics construction,
+    FeatureID.history_to_vector, Optimizer._preprocess_histories, a single Optimizer.objective evaluation and
+    Inference.infer with several beam sizes \n
+    The results are saved as json, and can be compared with baseline results to find slowdowns
+    """
+
+    def __init__(self, features_path: str, weights_path: str, corpus_path: str, data_directory: str = "Data",
+                 window_size: int = 3, max_histories: int = 2000, max_vectors: int = 500, max_preprocessed: int = 200,
+                 max_sentences: int = 30, beam_sizes: Sequence[int] = (1, 5, 10), repeat: int = 5):
+        """
+        Create a BenchmarkSuite object
+
+        :param features_path: The features of the model (json or a model bundle)
+        :param weights_path: The pickled weights of the model (the path of the bundle for a bundle)
+        :param corpus_path: The corpus the model was trained on
+        :param data_directory: The directory of the .wtag files to run over
+        :param window_size: The window size of the histories
+        :param max_histories: The number of histories to count the features of (from each file)
+        :param max_vectors: The number of histories to create feature vectors of
+        :param max_preprocessed: The number of histories to preprocess (and to evaluate the objective over)
+        :param max_sentences: The number of sentences to tag
+        :param beam_sizes: The beam sizes to tag with
+        :param repeat: The number of times to run each benchmark (the minimal and the median times are kept)
+        """
+        self.data_paths = sorted(glob.glob(os.path.join(data_directory, "*.wtag")))
+        self.window_size = window_size
+        self.max_histories = max_histories
+        self.max_vectors = max_vectors
+        self.max_preprocessed = max_preprocessed
+        self.max_sentences = max_sentences
+        self.beam_sizes = beam_sizes
+        self.repeat = repeat
+
+        self.feature_id = FeatureID.read_features(features_path)
+        history_handler = HistoryHandler(corpus_path, window_size)
+        self.optimizer = Optimizer(self.feature_id, history_handler, weights_path)
+        self.weights = np.asarray(self.optimizer.weights, dtype=np.float64)
+        self.inference = Inference(self.feature_id, self.weights, history_handler)
+
+    def _measure(self, function: Callable[[], Any], items: int) -> Dict[str, float]:
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return {"min_sec": min(timings), "median_sec": statistics.median(timings), "items": items,
+                "per_item_us": min(timings) / max(1, items) * 1e6}
+
+    def run(self, verbose: bool = True) -> Dict[str, Any]:
+        """
+        Run all of the benchmarks over all of the files
+
+        :param verbose: If True, prints each result
+        :return: The results, by the name of the benchmark ("<file>/<benchmark>"), and a description of the machine
+        """
+        results = dict()
+        for path in self.data_paths:
+            name = os.path.basename(path)
+            histories = HistoryHandler(path, self.window_size).create_histories(None, "ALL")
+            sentences = [words for words, _ in Evaluation.read_tagged(path)][:self.max_sentences]
+
+            counted = histories[:self.max_histories]
+            vectors = histories[:self.max_vectors]
+            preprocessed_histories = histories[:self.max_preprocessed]
+            preprocessed = self.optimizer._preprocess_histories(preprocessed_histories)
+
+            benchmarks = [
+                ("feature_statistics", lambda: FeatureStatistics(counted), len(counted)),
+                ("history_to_vector", lambda: [self.feature_id.history_to_vector(history) for history in vectors],
+                 len(vectors)),
+                ("preprocess_histories", lambda: self.optimizer._preprocess_histories(preprocessed_histories),
+                 len(preprocessed_histories)),
+                ("objective", lambda: Optimizer.objective(self.weights, *preprocessed, 0.5),
+                 len(preprocessed_histories)),
+            ]
+            for beam_size in self.beam_sizes:
+                benchmarks.append((f"infer_beam_{beam_size}",
+                                   lambda beam_size=beam_size: [self.inference.infer(words, beam_size)
+                                                                for words in sentences],
+                                   len(sentences)))
+
+            for benchmark, function, items in benchmarks:
+                results[f"{name}/{benchmark}"] = self._measure(function, items)
+                if verbose:
+                    print(f"{name}/{benchmark}: {results[f'{name}/{benchmark}']['min_sec'] * 1000: .2f} ms")
+
+        return {"machine": {"python": platform.python_version(), "processor": platform.processor(),
+                            "system": platform.platform()},
+                "results": results}
+
+    # <editor-fold desc="Baselines">
+    @staticmethod
+    def save(results: Dict[str, Any], path: str = BASELINE_PATH) -> None:
+        with open(path, "w") as file:
+            json.dump(results, file, indent=2)
+
+    @staticmethod
+    def load(path: str = BASELINE_PATH) -> Dict[str, Any]:
+        with open(path) as file:
+            return json.load(file)
+
+    @staticmethod
+    def compare(baseline: Dict[str, Any], results: Dict[str, Any], tolerance: float = 0.25) \
+            -> List[Tuple[str, float, float, float]]:
+        """
+        Find the benchmarks which are slower than the baseline (by their minimal time)
+
+        :param baseline: The baseline results (see run)
+        :param results: The new results
+        :param tolerance: The allowed relative slowdown
+        :return: The name, the baseline time, the new time and the ratio of each slower benchmark
+        """
+        slowdowns = []
+        for name, result in results["results"].items():
+            base = baseline["results"].get(name)
+            if base is None:
+                continue
+            ratio = result["min_sec"] / max(base["min_sec"], 1e-9)
+            if 1 + tolerance < ratio:
+                slowdowns.append((name, base["min_sec"], result["min_sec"], ratio))
+        return slowdowns
+
+    # </editor-fold>
@@ -0,0 +1 @@
+from ..Benchmark.BenchmarkSuite import BenchmarkSuite
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from typing import Dict, Iterator, List, Tuple
+from ..FeatureExtraction.History import History
+
+
+class CorpusStore:
+    """
+    Holds a tagged corpus as integer arrays (memory-mapped) \n
+    The words and the tags of all of the sentences are kept as word-IDs and tag-IDs, with the offset of each sentence.
+    The histories are created by index arithmetic over the arrays, the padding symbols are never stored
+    """
+
+    array_names = ("words", "tags", "offsets")
+    start_id = 0  # The ID of the start symbol (in both vocabularies)
+    end_id = 1  # The ID of the end symbol (in both vocabularies)
+
+    def __init__(self, directory: str):
+        """
+        Open a CorpusStore (see build)
+
+        :param directory: The directory of the store
+        """
+        self.directory = directory
+        self.words, self.tags, self.offsets = (np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                                               for name in CorpusStore.array_names)
+        with open(os.path.join(directory, "vocabulary.json")) as file:
+            vocabulary = json.load(file)
+        self.word_list = [sys.intern(word) for word in vocabulary["words"]]  # type: List[str]
+        self.tag_list = [sys.intern(tag) for tag in vocabulary["tags"]]  # type: List[str]
+
+    @property
+    def number_of_sentences(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def number_of_tokens(self) -> int:
+        return len(self.words)
+
+    # <editor-fold desc="Build">
+    @staticmethod
+    def build(file_path: str, directory: str, start: str, end: str) -> "CorpusStore":
+        """
+        Read a file of word_tag pairs (a sentence per line) into a store \n
+        The file is read twice (counting and filling), so the corpus does not have to fit in memory
+
+        :param file_path: The path to the file
+        :param directory: The directory to create the store in
+        :param start: The start symbol
+        :param end: The end symbol
+        :return: The store
+        """
+        number_of_tokens = 0
+        number_of_sentences = 0
+        with open(file_path) as file:
+            for line in file:
+                number_of_tokens += line.count(" ") + 1
+                number_of_sentences += 1
+
+        os.makedirs(directory, exist_ok=True)
+        paths = [os.path.join(directory, f"{name}.npy") for name in CorpusStore.array_names]
+        words = np.lib.format.open_memmap(paths[0], mode="w+", dtype=np.int32, shape=(number_of_tokens,))
+        tags = np.lib.format.open_memmap(paths[1], mode="w+", dtype=np.int32, shape=(number_of_tokens,))
+        offsets = np.lib.format.open_memmap(paths[2], mode="w+", dtype=np.int64, shape=(number_of_sentences + 1,))
+
+        word_ids = {start: CorpusStore.start_id, end: CorpusStore.end_id}  # type: Dict[str, int]
+        tag_ids = {start: CorpusStore.start_id, end: CorpusStore.end_id}  # type: Dict[str, int]
+        position = 0
+        offsets[0] = 0
+        with open(file_path) as file:
+            for index, line in enumerate(file):
+                for word_tag in line.strip("\n").split(" "):
+                    word, tag = word_tag.split("_")
+                    words[position] = word_ids.setdefault(word, len(word_ids))
+                    tags[position] = tag_ids.setdefault(tag, len(tag_ids))
+                    position += 1
+                offsets[index + 1] = position
+
+        words.flush()
+        tags.flush()
+        offsets.flush()
+        del words, tags, offsets
+
+        # The vocabulary is written last (marks the store as complete)
+        with open(os.path.join(directory, "vocabulary.json"), "w") as file:
+            json.dump({"words": list(word_ids), "tags": list(tag_ids)}, file)
+        return CorpusStore(directory)
+
+    @staticmethod
+    def open(file_path: str, start: str, end: str, cache_directory: str = "cache") -> "CorpusStore":
+        """
+        Open the store of the given file (builds the store if it does not exist)
+
+        :param file_path: The path to the file of word_tag pairs
+        :param start: The start symbol
+        :param end: The end symbol
+        :param cache_directory: The directory to keep the stores in
+        :return: The store
+        """
+        digest = hashlib.sha1(f"{start}{end}".encode())
+        with open(file_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        directory = os.path.join(cache_directory, f"corpus_{digest.hexdigest()}")
+        if os.path.exists(os.path.join(directory, "vocabulary.json")):
+            return CorpusStore(directory)
+        return CorpusStore.build(file_path, directory, start, end)
+
+    # </editor-fold>
+
+    # <editor-fold desc="Histories">
+    def windows(self, sentences: np.ndarray, window_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Create the history windows of the given sentences
+
+        :param sentences: The indices of the sentences
+        :param window_size: The number of words in a history
+        :return: The word-IDs and the tag-IDs of the histories (arrays of shape (number of histories, window_size))
+                 and the word-ID of the next word of each history
+        """
+        sentences = np.asarray(sentences, dtype=np.int64)
+        starts = np.asarray(self.offsets[sentences], dtype=np.int64)
+        ends = np.asarray(self.offsets[sentences + 1], dtype=np.int64)
+        lengths = ends - starts
+
+        # The position of the current word of each history, and the bounds of its sentence
+        sentence_starts = np.repeat(starts, lengths)
+        sentence_ends = np.repeat(ends, lengths)
+        positions = sentence_starts + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        # Positions before the start of the sentence are the start symbol
+        window_positions = positions[:, np.newaxis] + np.arange(1 - window_size, 1)
+        padding = window_positions < sentence_starts[:, np.newaxis]
+        window_positions[padding] = 0
+        word_windows = np.where(padding, CorpusStore.start_id, self.words[window_positions])
+        tag_windows = np.where(padding, CorpusStore.start_id, self.tags[window_positions])
+
+        # The word after the end of the sentence is the end symbol
+        next_positions = positions + 1
+        after_end = next_positions == sentence_ends
+        next_positions[after_end] = 0
+        next_words = np.where(after_end, CorpusStore.end_id, self.words[next_positions])
+
+        return word_windows, tag_windows, next_words
+
+    def to_histories(self, word_windows: np.ndarray, tag_windows: np.ndarray,
+                     next_words: np.ndarray) -> List[History]:
+        """
+        Convert history windows (see windows) into History objects
+        """
+        word_list = self.word_list
+        tag_list = self.tag_list
+        return [History(tuple(word_list[word] for word in words), tuple(tag_list[tag] for tag in tags),
+                        (word_list[next_word],))
+                for words, tags, next_word in zip(word_windows.tolist(), tag_windows.tolist(), next_words.tolist())]
+
+    def choose_sentences(self, max_number: int = None, style: str = "ALL", **kwargs) -> np.ndarray:
+        """
+        Choose sentences (see HistoryHandler.create_histories for the styles)
+
+        :return: The indices of the chosen sentences
+        """
+        if style == "ALL":
+            sentences = np.arange(self.number_of_sentences)
+            return sentences if max_number is None else sentences[:max_number]
+        elif style == "RANDOM":
+            return np.random.choice(self.number_of_sentences, min(max_number, self.number_of_sentences),
+                                    replace=False)
+        elif style == "INCREMENT":
+            return (kwargs["start"] + kwargs["step"] * np.arange(max_number)) % self.number_of_sentences
+        return np.empty(0, dtype=np.int64)
+
+    def histories(self, window_size: int, max_number: int = None, style: str = "ALL", **kwargs) -> List[History]:
+        """
+        Create the histories of chosen sentences (see HistoryHandler.create_histories)
+        """
+        return self.to_histories(*self.windows(self.choose_sentences(max_number, style, **kwargs), window_size))
+
+    def iter_windows(self, window_size: int, chunk_size: int = 1024) \
+            -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Iterate over the history windows of all of the sentences, a chunk of sentences at a time
+
+        :param window_size: The number of words in a history
+        :param chunk_size: The number of sentences in each chunk
+        :return: yields the windows of each chunk (see windows)
+        """
+        for start in range(0, self.number_of_sentences, chunk_size):
+            yield self.windows(np.arange(start, min(start + chunk_size, self.number_of_sentences)), window_size)
+
+    def iter_histories(self, window_size: int, chunk_size: int = 1024) -> Iterator[History]:
+        """
+        Iterate over the histories of all of the sentences (only a chunk of sentences is in memory at a time)
+        """
+        for windows in self.iter_windows(window_size, chunk_size):
+            for history in self.to_histories(*windows):
+                yield history
+    # </editor-fold>
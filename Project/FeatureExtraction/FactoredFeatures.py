@@ -0,0 +1,161 @@
+import numpy as np
+import scipy.sparse
+from typing import Dict, Iterable, List, Optional, Tuple
+from ..FeatureExtraction.FeatureID import FeatureID
+from ..FeatureExtraction.HashedFeatures import HashedFeatures
+from ..FeatureExtraction.History import History
+from ..Profiling import instrumentation
+
+
+class FactoredFeatures:
+    """
+    Factors each feature into an observation (everything but the last tag) and the last tag \n
+    A history is then represented by its observations (which do not depend on the tag of the current word)
+    and its tag, instead of a feature vector for every possible tag
+    """
+
+    def __init__(self, feature_id: FeatureID, tags: Iterable[str]):
+        """
+        Create a FactoredFeatures object
+
+        :param feature_id: The features
+        :param tags: The tags, the position of a tag in the list is its index
+        """
+        self.feature_id = feature_id
+        self.tags = list(tags)
+        self.tag_index = {tag: index for index, tag in enumerate(self.tags)}
+
+        # From an observation (words, next words, previous tags) to its index
+        self.observations = dict()  # type: Dict[Tuple, int]
+
+        # In the feature-hashing mode the observations are the observation buckets (see HashedFeatures)
+        self.hashed = feature_id.features_dict if feature_id.hashed_features else None  # type: Optional[HashedFeatures]
+        if self.hashed is not None:
+            self._hashed_table()
+        else:
+            # The feature of each (observation, tag) pair, as the arrays of a sparse table
+            rows, columns, features = [], [], []
+            for key, feature in feature_id.features_dict.items():
+                if key.tags and key.tags[-1] in self.tag_index:
+                    observation = (key.words, key.next_words, key.tags[:-1])
+                    rows.append(self.observations.setdefault(observation, len(self.observations)))
+                    columns.append(self.tag_index[key.tags[-1]])
+                    features.append(feature)
+            self.rows = np.array(rows, dtype=np.int32)
+            self.columns = np.array(columns, dtype=np.int32)
+            self.features = np.array(features, dtype=np.int32)
+
+        self._word_observations = dict()  # type: Dict[str, List[int]]
+
+    @property
+    def number_of_observations(self) -> int:
+        if self.hashed is not None:
+            return self.hashed.number_of_observations
+        return len(self.observations)
+
+    def _hashed_table(self) -> None:
+        """
+        Create the table of the feature-hashing mode, every (observation bucket, tag) pair is a feature
+        """
+        columns = np.array([index for index, tag in enumerate(self.tags) if tag in self.hashed.tag_index],
+                           dtype=np.int32)
+        hashed_columns = np.array([self.hashed.tag_index[self.tags[column]] for column in columns], dtype=np.int32)
+        number_of_buckets = self.hashed.number_of_observations
+        self.rows = np.repeat(np.arange(number_of_buckets, dtype=np.int32), len(columns))
+        self.columns = np.tile(columns, number_of_buckets)
+        self.features = self.rows * np.int32(len(self.hashed.tags)) + np.tile(hashed_columns, number_of_buckets)
+
+    def _observations_of_word(self, word: str) -> List[int]:
+        """
+        Get the indices of the observations that depend only on the word (cached per word)
+        """
+        observations = self._word_observations.get(word)
+        if instrumentation.enabled:
+            instrumentation.count("observation_cache_misses" if observations is None else "observation_cache_hits")
+        if observations is None:
+            history = History((word,), (None,))
+            observations = []
+            for func in self.feature_id.feature_statistics.observation_functions:
+                for key in func(history):
+                    observation = self.observations.get((key.words, key.next_words, tuple()))
+                    if observation is not None:
+                        observations.append(observation)
+            self._word_observations[word] = observations
+        return observations
+
+    def histories_to_observations(self, histories: Iterable[History]) -> Tuple[scipy.sparse.csr_matrix, np.ndarray]:
+        """
+        Create the observations of the given histories
+
+        :param histories: The histories
+        :return: A csr_matrix of shape (number of histories, number of observations), each row marks the observations
+                 of a history<br>
+                 The index of the tag of each history
+        """
+        if self.hashed is not None:
+            return self._hashed_histories_to_observations(histories)
+
+        get_observation = self.observations.get
+        get_context_keys = self.feature_id.feature_statistics.get_context_keys
+
+        indptr = [0]
+        indices = []
+        tags = []
+        instrumented = instrumentation.enabled
+        lookups = misses = 0
+        for history in histories:
+            # Replace the current tag, so the keys would not depend on it
+            tagless_history = History(history.words, (*history.tags[:-1], None), history.next_words)
+            if instrumented:
+                found = [get_observation((key.words, key.next_words, key.tags[:-1]))
+                         for key in get_context_keys(tagless_history)]
+                lookups += len(found)
+                misses += found.count(None)
+                observations = set(found)
+            else:
+                observations = {get_observation((key.words, key.next_words, key.tags[:-1]))
+                                for key in get_context_keys(tagless_history)}
+            observations.discard(None)
+            observations.update(self._observations_of_word(history.words[-1]))
+
+            indices.extend(sorted(observations))
+            indptr.append(len(indices))
+            tags.append(self.tag_index[history.tags[-1]])
+
+        if instrumented:
+            instrumentation.count("feature_lookups", lookups)
+            instrumentation.count("feature_misses", misses)
+
+        observations_matrix = scipy.sparse.csr_matrix(
+            (np.ones(len(indices)), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int32)),
+            shape=(len(tags), self.number_of_observations))
+        return observations_matrix, np.array(tags, dtype=np.int32)
+
+    def _hashed_histories_to_observations(self, histories: Iterable[History]) \
+            -> Tuple[scipy.sparse.csr_matrix, np.ndarray]:
+        """
+        histories_to_observations of the feature-hashing mode,
+        the value of an observation bucket is the sum of the signs of its observations
+        """
+        observation_bucket = self.hashed.observation_bucket
+        get_keys = self.feature_id.feature_statistics.get_keys
+
+        rows, columns, data = [], [], []
+        tags = []
+        for row, history in enumerate(histories):
+            tagless_history = History(history.words, (*history.tags[:-1], None), history.next_words)
+            for observation in {(key.words, key.next_words, key.tags[:-1]) for key in get_keys(tagless_history)}:
+                bucket, sign = observation_bucket(observation)
+                rows.append(row)
+                columns.append(bucket)
+                data.append(sign)
+            tags.append(self.tag_index[history.tags[-1]])
+
+        if instrumentation.enabled:
+            instrumentation.count("feature_lookups", len(columns))
+
+        # Colliding observations are summed by the conversion to csr
+        observations_matrix = scipy.sparse.coo_matrix(
+            (np.array(data, dtype=np.float64), (rows, columns)),
+            shape=(len(tags), self.number_of_observations)).tocsr()
+        return observations_matrix, np.array(tags, dtype=np.int32)
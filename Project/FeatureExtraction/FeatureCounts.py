@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from ..FeatureExtraction.FeatureID import FeatureID
+from ..FeatureExtraction.FeatureStatistics import FeatureStatistics
+from ..FeatureExtraction.Key import Key
+
+
+class FeatureCounts:
+    """
+    Holds the raw counts of all of the keys as arrays (saved as .npy files and loaded memory-mapped) \n
+    Each key is kept as the string-IDs of its words, tags and next words, with its count and the parameters of its
+    threshold (the name and the length), so the features can be chosen again for any threshold polynomials
+    without counting the histories again
+    """
+
+    array_names = ("parts", "counts", "thresholds", "lengths")
+
+    def __init__(self, strings: List[str], widths: Tuple[int, int, int], parts: np.ndarray, counts: np.ndarray,
+                 thresholds: np.ndarray, lengths: np.ndarray):
+        """
+        Create a FeatureCounts object
+
+        :param strings: The words and the tags, the position of a string in the list is its ID
+        :param widths: The maximal number of words, tags and next words in a key
+        :param parts: The string-IDs of the words, the tags and the next words of each key (a row per key,
+                      padded with -1)
+        :param counts: The number of occurrences of each key
+        :param thresholds: The index of the threshold of each key (in FeatureStatistics.threshold_names)
+        :param lengths: The argument of the threshold of each key
+        """
+        self.strings = strings
+        self.widths = widths
+        self.parts = parts
+        self.counts = counts
+        self.thresholds = thresholds
+        self.lengths = lengths
+
+    @property
+    def number_of_keys(self) -> int:
+        return len(self.counts)
+
+    @staticmethod
+    def from_statistics(feature_statistics: FeatureStatistics) -> "FeatureCounts":
+        """
+        Create the table from the counts of a FeatureStatistics object
+        """
+        keys = list(feature_statistics.feature_dictionary)
+        widths = (max((len(key.words) for key in keys), default=0),
+                  max((len(key.tags) for key in keys), default=0),
+                  max((len(key.next_words) for key in keys), default=0))
+
+        string_ids = dict()  # type: Dict[str, int]
+        parts = np.full((len(keys), sum(widths)), -1, dtype=np.int32)
+        thresholds = np.empty(len(keys), dtype=np.int8)
+        lengths = np.empty(len(keys), dtype=np.int16)
+        threshold_index = {name: index for index, name in enumerate(FeatureStatistics.threshold_names)}
+        for row, key in enumerate(keys):
+            column = 0
+            for part, width in zip((key.words, key.tags, key.next_words), widths):
+                parts[row, column:column + len(part)] = [string_ids.setdefault(string, len(string_ids))
+                                                         for string in part]
+                column += width
+            name, length = feature_statistics.threshold_parameters(key)
+            thresholds[row] = threshold_index[name]
+            lengths[row] = length
+
+        counts = np.fromiter(feature_statistics.feature_dictionary.values(), dtype=np.int64, count=len(keys))
+        return FeatureCounts(list(string_ids), widths, parts, counts, thresholds, lengths)
+
+    # <editor-fold desc="Thresholds">
+    def key_thresholds(self, polynomials: Dict[str, List[float]] = None) -> np.ndarray:
+        """
+        Calculate the threshold of every key
+
+        :param polynomials: The coefficients of the thresholds to replace, by the name of the threshold
+                            (see FeatureStatistics.threshold_names), the rest are the thresholds of FeatureStatistics
+        :return: The threshold of each key
+        """
+        polynomials = polynomials or dict()
+        lengths = np.asarray(self.lengths, dtype=np.float64)
+        key_thresholds = np.ones(self.number_of_keys, dtype=np.int64)
+        for index, name in enumerate(FeatureStatistics.threshold_names):
+            coefficients = polynomials.get(name, getattr(FeatureStatistics, name).coefficients)
+            mask = np.asarray(self.thresholds) == index
+            total = np.zeros(mask.sum())
+            for power, coefficient in enumerate(coefficients):
+                total += coefficient * lengths[mask] ** power
+            key_thresholds[mask] = np.maximum(1, total).astype(np.int64)
+        return key_thresholds
+
+    def feature_id(self, polynomials: Dict[str, List[float]] = None) -> FeatureID:
+        """
+        Choose the features by the given thresholds (the IDs are in the order of the keys, as in
+        FeatureID.serialize_features)
+
+        :param polynomials: The coefficients of the thresholds (see key_thresholds)
+        :return: A FeatureID object of the chosen features
+        """
+        key_thresholds = self.key_thresholds(polynomials)
+        chosen = np.flatnonzero(key_thresholds <= self.counts)
+
+        strings = self.strings
+        words_end, tags_end = self.widths[0], self.widths[0] + self.widths[1]
+        feature_id = FeatureID()
+        feature_id.features_dict = OrderedDict()
+        for feature, (row, threshold) in enumerate(zip(self.parts[chosen].tolist(), key_thresholds[chosen].tolist())):
+            key = Key(tuple(strings[i] for i in row[:words_end] if i >= 0),
+                      tuple(strings[i] for i in row[words_end:tags_end] if i >= 0), threshold,
+                      tuple(strings[i] for i in row[tags_end:] if i >= 0))
+            feature_id.features_dict[key] = feature
+        feature_id.id_counter = len(feature_id.features_dict)
+        return feature_id
+
+    # </editor-fold>
+
+    # <editor-fold desc="I/O">
+    def save(self, directory: str) -> None:
+        """
+        Save the table into the given directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in FeatureCounts.array_names:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+        # The strings are written last (marks the table as complete)
+        with open(os.path.join(directory, "strings.json"), "w") as file:
+            json.dump({"strings": self.strings, "widths": self.widths}, file)
+
+    @staticmethod
+    def load(directory: str) -> "FeatureCounts":
+        """
+        Load a table (memory-mapped) from the given directory (see save)
+        """
+        with open(os.path.join(directory, "strings.json")) as file:
+            data = json.load(file)
+        arrays = (np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in FeatureCounts.array_names)
+        return FeatureCounts([sys.intern(string) for string in data["strings"]], tuple(data["widths"]), *arrays)
+
+    # </editor-fold>
@@ -1,9 +1,16 @@
+import json
+import sys
 from collections import OrderedDict
+from typing import Iterable, List
+import numpy as np
 import scipy.sparse
 from ..FeatureExtraction.FeatureStatistics import FeatureStatistics
+from ..FeatureExtraction.HashedFeatures import HashedFeatures
 from ..FeatureExtraction.History import History
 from ..FeatureExtraction.Key import Key
-import pandas as pd
+from ..FeatureExtraction.ModelBundle import BundleFeatures, ModelBundle
+from ..FeatureExtraction.ObservationIndex import ObservationIndex
+from ..Profiling import instrumentation
 
 
 class FeatureID:
@@ -22,6 +29,8 @@ class FeatureID:
 
         # Initialize feature dictionary
         self.features_dict = OrderedDict()
+        self._observation_index = None
+        self.bundle = None  # The model bundle the features were loaded from (see read_features_from_bundle)
 
         if feature_statistics is not None:
             self.feature_statistics = feature_statistics
@@ -30,14 +39,46 @@ class FeatureID:
         else:
             self.feature_statistics = FeatureStatistics([])
 
+    @staticmethod
+    def hashed(tags: Iterable[str], size: int = 2 ** 20, signed: bool = False) -> "FeatureID":
+        """
+        Create a FeatureID object in the feature-hashing mode (see HashedFeatures): the number of features is fixed
+        and no keys are kept, there is no counting pass and no thresholds
+
+        :param tags: The tags of the corpus (sorted, as the tags of the Optimizer and the Inference)
+        :param size: The maximal number of features
+        :param signed: If True, each observation has a sign (+1 or -1) which multiplies its value
+        :return: The FeatureID object
+        """
+        feature_id = FeatureID()
+        feature_id.features_dict = HashedFeatures(tags, size, signed)
+        feature_id.id_counter = feature_id.features_dict.size
+        return feature_id
+
+    @property
+    def hashed_features(self) -> bool:
+        return isinstance(self.features_dict, HashedFeatures)
+
     @property
     def number_of_features(self):
         return self.id_counter
 
+    @property
+    def observation_index(self) -> ObservationIndex:
+        """
+        The per-word cache of the observation features (built on first use)
+        """
+        if self._observation_index is None:
+            self._observation_index = ObservationIndex(self.features_dict,
+                                                       self.feature_statistics.observation_functions)
+        return self._observation_index
+
     def serialize_features(self):
         """
         Extract all relevant features from feature-statistics
         """
+        import pandas as pd  # Imported here, so loading a model does not import pandas
+
         chosen_features = dict()
 
         for key, count in self.feature_statistics.feature_dictionary.items():
@@ -50,31 +91,156 @@ class FeatureID:
             .to_csv("Features_Threshold.csv", header=False)
 
     def history_to_vector(self, history: History) -> scipy.sparse.csc_matrix:
-        feature_vector = scipy.sparse.dok_matrix((self.number_of_features, 1), dtype=int)
-        for key in self.feature_statistics.get_keys(history):
-            try:
-                feature_vector[self.features_dict[key], 0] = 1
-            except KeyError:
-                pass
-        return feature_vector.tocsc()
+        return self.histories_to_csr([history]).T
+
+    def histories_to_csr(self, histories: Iterable[History]) -> scipy.sparse.csr_matrix:
+        """
+        Create the feature vectors of the given histories as a single sparse matrix
+
+        :param histories: The histories to create the feature vectors from
+        :return: A csr_matrix of shape (number of histories, number of features), each row is a feature vector
+        """
+        histories = list(histories)
+        if self.hashed_features:
+            return self._hashed_histories_to_csr(histories)
+
+        get_feature = self.features_dict.get
+        get_context_keys = self.feature_statistics.get_context_keys
+        lookup_observations = self.observation_index.lookup
+
+        indptr = np.empty(len(histories) + 1, dtype=np.int32)
+        indices = np.empty(64 * max(1, len(histories)), dtype=np.int32)
+        indptr[0] = 0
+        nnz = 0
+        instrumented = instrumentation.enabled
+        lookups = misses = 0
+        for row, history in enumerate(histories):
+            if instrumented:
+                found = [get_feature(key) for key in get_context_keys(history)]
+                lookups += len(found)
+                misses += found.count(None)
+                features = set(found)
+            else:
+                features = {get_feature(key) for key in get_context_keys(history)}
+            features.discard(None)
+            features.update(lookup_observations(history.words[-1], history.tags[-1]))
+            end = nnz + len(features)
+            if len(indices) < end:
+                # Grow the buffer geometrically
+                indices = np.resize(indices, max(2 * len(indices), end))
+            indices[nnz:end] = sorted(features)
+            nnz = end
+            indptr[row + 1] = nnz
+
+        if instrumented:
+            instrumentation.count("feature_lookups", lookups)
+            instrumentation.count("feature_misses", misses)
+            instrumentation.count("sparse_vectors", len(histories))
+
+        data = np.ones(nnz, dtype=int)
+        return scipy.sparse.csr_matrix((data, indices[:nnz], indptr),
+                                       shape=(len(histories), self.number_of_features))
+
+    def _hashed_histories_to_csr(self, histories: List[History]) -> scipy.sparse.csr_matrix:
+        """
+        histories_to_csr of the feature-hashing mode (there is no observation index),
+        the value of a feature is the sum of the signs of its keys
+        """
+        lookup = self.features_dict.lookup
+        get_keys = self.feature_statistics.get_keys
+
+        rows, columns, data = [], [], []
+        misses = 0
+        for row, history in enumerate(histories):
+            for found in map(lookup, set(get_keys(history))):
+                if found is None:
+                    misses += 1
+                    continue
+                rows.append(row)
+                columns.append(found[0])
+                data.append(found[1])
+
+        if instrumentation.enabled:
+            instrumentation.count("feature_lookups", len(columns) + misses)
+            instrumentation.count("feature_misses", misses)
+            instrumentation.count("sparse_vectors", len(histories))
+
+        # Colliding keys are summed by the conversion to csr
+        return scipy.sparse.coo_matrix((np.array(data, dtype=int), (rows, columns)),
+                                       shape=(len(histories), self.number_of_features)).tocsr()
 
     # <editor-fold desc="I/O json">
     @staticmethod
     def read_features_from_json(path: str):
+        # A model in the feature-hashing mode is saved as the parameters of its features (see save_feature_as_json)
+        with open(path) as file:
+            if file.read(1) == "{":
+                file.seek(0)
+                return FeatureID.hashed(**json.load(file)["hashed"])
+
+        import pandas as pd
 
         feature_id = FeatureID()
         feature_id.features_dict = OrderedDict()
 
         dictionary = pd.read_json(path).to_dict(orient="records")
         for d in dictionary:
-            key = Key(tuple(d["Words"]), tuple(d["Tags"]), 1, tuple(d["Next_Words"]))
+            # Intern the strings, so equal words and tags share a single object
+            key = Key(tuple(map(sys.intern, d["Words"])), tuple(map(sys.intern, d["Tags"])), 1,
+                      tuple(map(sys.intern, d["Next_Words"])))
             feature_id.features_dict[key] = d["Value"]
         feature_id.id_counter = len(feature_id.features_dict.keys())
 
         return feature_id
 
     def save_feature_as_json(self, path: str):
+        if self.hashed_features:
+            # There are no keys to save, the features are recreated from their parameters
+            with open(path, "w") as file:
+                json.dump({"hashed": self.features_dict.parameters}, file)
+            return
+        import pandas as pd
+
         data = [[[*key.words], [*key.tags], value, [*key.next_words]] for key, value in self.features_dict.items()]
         pd.DataFrame(data, columns=["Words", "Tags", "Value", "Next_Words"]) \
             .to_json(path, orient="records")
     # </editor-fold>
+
+    # <editor-fold desc="I/O bundle">
+    @staticmethod
+    def read_features_from_bundle(path: str) -> "FeatureID":
+        """
+        Load the features of a model bundle (see ModelBundle), the bundle is memory-mapped and the keys are decoded
+        only when iterated over
+
+        :param path: The path to the bundle file
+        :return: The FeatureID object, its bundle attribute holds the bundle (with the weights)
+        """
+        bundle = ModelBundle(path)
+        if bundle.hashed is not None:
+            feature_id = FeatureID.hashed(**bundle.hashed)
+        else:
+            feature_id = FeatureID()
+            feature_id.features_dict = BundleFeatures(bundle)
+            feature_id.id_counter = bundle.number_of_features
+        feature_id.bundle = bundle
+        return feature_id
+
+    @staticmethod
+    def read_features(path: str) -> "FeatureID":
+        """
+        Load the features from a model bundle or a json file (by the content of the file)
+        """
+        if ModelBundle.is_bundle(path):
+            return FeatureID.read_features_from_bundle(path)
+        return FeatureID.read_features_from_json(path)
+
+    def save_bundle(self, path: str, weights: np.ndarray) -> None:
+        """
+        Save the features with the given weights as a model bundle (see ModelBundle)
+        """
+        if self.hashed_features:
+            ModelBundle.write(path, dict(), weights, hashed=self.features_dict.parameters)
+        else:
+            ModelBundle.write(path, self.features_dict, weights)
+    # </editor-fold>
@@ -1,5 +1,8 @@
+import os
 from collections import OrderedDict
-from typing import Iterable, List, Callable
+from functools import lru_cache
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Callable, Sequence, Tuple
 from ..FeatureExtraction.History import History
 from ..FeatureExtraction.Key import Key
 import re
@@ -13,15 +16,22 @@ def polynomial_threshold(coefficients: List[float]) -> Callable[[int], int]:
     :return: A function that takes the number of elements in the k-gram and returns the threshold
     """
 
+    @lru_cache(maxsize=None)
     def threshold(length: int) -> int:
         total = 0
         for index, coefficient in enumerate(coefficients):
             total += coefficient * length ** index
         return int(max(1, total))
 
+    threshold.coefficients = coefficients
     return threshold
 
 
+def _count_shard(histories: Sequence[History]) -> Tuple[Dict[Key, int], Dict[Key, int]]:
+    feature_statistics = FeatureStatistics(histories)
+    return feature_statistics.feature_dictionary, feature_statistics.key_sources
+
+
 class FeatureStatistics:
     """
     Gets the feature for the given histories
@@ -41,11 +51,28 @@ class FeatureStatistics:
     length_Threshold = polynomial_threshold([10])
     next_word_Threshold = polynomial_threshold([5])
 
+    threshold_names = ("Has_Pun_Threshold", "Alphanum_Threshold", "Has_num_Threshold", "All_num_Threshold",
+                       "Start_Capital_Threshold", "All_Capital_Threshold", "Prefix_Threshold", "Suffix_Threshold",
+                       "n_gram_Threshold", "n_gram_tags_Threshold", "length_Threshold", "next_word_Threshold")
+    capital_thresholds = {"Starts_Capital": "Start_Capital_Threshold", "All_Capital": "All_Capital_Threshold"}
+    alpha_num_thresholds = {"Has_Num": "Has_num_Threshold", "All_num": "All_num_Threshold",
+                            "Is_alnum": "Alphanum_Threshold", "Has_pun": "Has_Pun_Threshold"}
+
     # </editor-fold>
 
-    def __init__(self, histories: Iterable[History]):
+    def __init__(self, histories: Iterable[History], processes: int = 1):
+        """
+        Create a FeatureStatistics object (counts the keys of the histories)
+
+        :param histories: The histories to count the keys of
+        :param processes: The number of processes to count with, each one counts a contiguous shard of the histories
+                          (if None, uses all of the cores)
+        """
         self.feature_dictionary = OrderedDict()
 
+        # The index (in feature_functions) of the function that created each key first
+        self.key_sources = dict()  # type: Dict[Key, int]
+
         self.feature_functions = [
             FeatureStatistics.create_capital_features,
             FeatureStatistics.create_prefix_features,
@@ -57,18 +84,93 @@ class FeatureStatistics:
             FeatureStatistics.create_next_word_feature,
         ]
 
+        # The features that depend only on the current word (and tag)
+        self.observation_functions = [
+            FeatureStatistics.create_capital_features,
+            FeatureStatistics.create_prefix_features,
+            FeatureStatistics.create_suffix_features,
+            FeatureStatistics.create_alpha_num_features,
+        ]
+        self.context_functions = [func for func in self.feature_functions
+                                  if func not in self.observation_functions]
+
         # Create all relevant features
-        for history in histories:
-            self.initialize_feature_dictionary(history)
+        if processes == 1:
+            for history in histories:
+                self.initialize_feature_dictionary(history)
+        else:
+            self.count_in_parallel(list(histories), processes)
 
     def initialize_feature_dictionary(self, history: History) -> None:
         """
         Call all of the feature-extraction function
         """
-        for key in self.get_keys(history):
-            if key not in self.feature_dictionary:
-                self.feature_dictionary[key] = 0
-            self.feature_dictionary[key] += 1
+        feature_dictionary = self.feature_dictionary
+        for index, func in enumerate(self.feature_functions):
+            for key in func(history):
+                count = feature_dictionary.get(key)
+                if count is None:
+                    feature_dictionary[key] = 1
+                    self.key_sources[key] = index
+                else:
+                    feature_dictionary[key] = count + 1
+
+    def count_in_parallel(self, histories: Sequence[History], processes: int = None) -> None:
+        """
+        Count the keys of the histories, split into contiguous shards counted by worker processes
+
+        :param histories: The histories to count the keys of
+        :param processes: The number of processes (if None, uses all of the cores)
+        """
+        processes = max(1, min(processes or os.cpu_count() or 1, len(histories)))
+        bounds = [len(histories) * index // processes for index in range(processes + 1)]
+        shards = [histories[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        with Pool(processes) as pool:
+            for feature_dictionary, key_sources in pool.imap(_count_shard, shards):
+                self.merge(feature_dictionary, key_sources)
+
+    def merge(self, feature_dictionary: Dict[Key, int], key_sources: Dict[Key, int]) -> None:
+        """
+        Add the counts of another FeatureStatistics object \n
+        Merging the shards in their order keeps the order of the keys (and so the IDs) of a sequential count
+
+        :param feature_dictionary: The counts of the keys
+        :param key_sources: The source function of each key (see key_sources)
+        """
+        own_dictionary = self.feature_dictionary
+        for key, count in feature_dictionary.items():
+            own_count = own_dictionary.get(key)
+            if own_count is None:
+                own_dictionary[key] = count
+                self.key_sources[key] = key_sources[key]
+            else:
+                own_dictionary[key] = own_count + count
+
+    def threshold_parameters(self, key: Key) -> Tuple[str, int]:
+        """
+        Get the threshold of a counted key, as the name of the threshold attribute and the argument it was called with
+
+        :param key: The key (created by one of the feature functions)
+        :return: The name of the threshold and the length of the key
+        """
+        name = self.feature_functions[self.key_sources[key]].__name__
+        if name == "create_capital_features":
+            return FeatureStatistics.capital_thresholds[key.words[0]], 1
+        elif name == "create_alpha_num_features":
+            return FeatureStatistics.alpha_num_thresholds[key.words[0]], 1
+        elif name == "create_prefix_features":
+            return "Prefix_Threshold", len(key.words[0]) - len("PREFIX_")
+        elif name == "create_suffix_features":
+            return "Suffix_Threshold", len(key.words[0]) - len("SUFFIX_")
+        elif name == "create_n_gram_features":
+            return "n_gram_Threshold", len(key.tags)
+        elif name == "create_n_gram_tags_features":
+            return "n_gram_tags_Threshold", len(key.tags)
+        elif name == "create_length_features":
+            # The exact length of the word is not kept in the key, the upper bound of its range is used
+            bound = key.words[0].split("-")[-1].lstrip("Length_>")
+            return "length_Threshold", int(bound)
+        return "next_word_Threshold", 1
 
     def get_keys(self, history: History) -> Iterable[Key]:
         for func in self.feature_functions:
@@ -76,6 +178,15 @@ class FeatureStatistics:
             for key in keys:
                 yield key
 
+    def get_context_keys(self, history: History) -> Iterable[Key]:
+        """
+        Get only the keys which are not observation keys (see observation_functions)
+        """
+        for func in self.context_functions:
+            keys = func(history)
+            for key in keys:
+                yield key
+
     # <editor-fold desc="create_features functions">
     @staticmethod
     def create_capital_features(history: History) -> Iterable[Key]:
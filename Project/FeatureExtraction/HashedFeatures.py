@@ -0,0 +1,86 @@
+import functools
+import hashlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+from ..FeatureExtraction.Key import Key
+
+
+_low_bits = (1 << 63) - 1  # All of the bits of the hash but the sign bit
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _observation_digest(observation: Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]) -> int:
+    words, next_words, previous_tags = observation
+    text = "\x1e".join(("\x1f".join(words), "\x1f".join(next_words), "\x1f".join(previous_tags)))
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+class HashedFeatures:
+    """
+    The features dictionary of the feature-hashing mode, there is no counting pass, no thresholds and no stored keys \n
+    A key is factored into its observation (everything but the last tag, see FactoredFeatures) and its last tag.
+    The observation is hashed (with a stable hash) into one of a fixed number of observation buckets, and the feature
+    of the key is (observation bucket, tag), so the weights are a fixed (observation buckets x tags) table. \n
+    If signed, each observation also gets a stable sign (+1 or -1), so colliding observations cancel out
+    in expectation. \n
+    Every key whose last tag is one of the tags has a feature (there is nothing to iterate over)
+    """
+
+    def __init__(self, tags: Iterable[str], size: int = 2 ** 20, signed: bool = False):
+        """
+        Create a HashedFeatures object
+
+        :param tags: The tags, the position of a tag in the list is its column in the weights table
+        :param size: The maximal number of features (rounded down to a multiple of the number of tags)
+        :param signed: If True, each observation has a sign (see observation_bucket)
+        """
+        self.tags = list(tags)
+        self.tag_index = {tag: index for index, tag in enumerate(self.tags)}
+        self.number_of_observations = max(1, size // len(self.tags))
+        self.signed = signed
+
+    @property
+    def size(self) -> int:
+        """
+        The number of features
+        """
+        return self.number_of_observations * len(self.tags)
+
+    @property
+    def parameters(self) -> Dict[str, Any]:
+        """
+        The arguments which recreate the features (see FeatureID.hashed), this is all that is saved of a model
+        """
+        return {"tags": self.tags, "size": self.size, "signed": self.signed}
+
+    def observation_bucket(self, observation: Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]) \
+            -> Tuple[int, int]:
+        """
+        :param observation: The words, the next words and the previous tags of a key
+        :return: The bucket and the sign of the observation (the sign is the highest bit of the hash,
+                 the bucket is chosen by the other bits, so the two are independent)
+        """
+        value = _observation_digest(observation)
+        return (value & _low_bits) % self.number_of_observations, -1 if self.signed and value >> 63 else 1
+
+    def lookup(self, key: Key) -> Optional[Tuple[int, int]]:
+        """
+        :return: The feature and the sign of the key, or None if its last tag is not one of the tags
+        """
+        column = self.tag_index.get(key.tags[-1]) if key.tags else None
+        if column is None:
+            return None
+        row, sign = self.observation_bucket((key.words, key.next_words, key.tags[:-1]))
+        return row * len(self.tags) + column, sign
+
+    def get(self, key: Key, default: Optional[int] = None) -> Optional[int]:
+        found = self.lookup(key)
+        return default if found is None else found[0]
+
+    def __getitem__(self, key: Key) -> int:
+        found = self.lookup(key)
+        if found is None:
+            raise KeyError(key)
+        return found[0]
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, Key) and bool(key.tags) and key.tags[-1] in self.tag_index
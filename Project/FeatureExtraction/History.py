@@ -2,6 +2,8 @@ from typing import Tuple
 
 
 class History:
+    __slots__ = ("words", "tags", "next_words")
+
     def __init__(self, words: Tuple[str, ...], tags: Tuple[str, ...], next_words: Tuple[str, ...] = tuple()):
         self.words = words
         self.tags = tags
@@ -16,7 +18,7 @@ class History:
         return False
 
     def __hash__(self):
-        return hash(self.words) ^ hash(self.tags) ^ hash(self.next_words)
+        return hash((self.words, self.tags, self.next_words))
 
     def __repr__(self):
         return f"words: {self.words}, tags: {self.tags}, next words: {self.next_words}"
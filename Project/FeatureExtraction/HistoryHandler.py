@@ -1,7 +1,11 @@
 from ..FeatureExtraction.History import History
-from typing import List
+from ..FeatureExtraction.CorpusStore import CorpusStore
+from ..Profiling import instrumentation
+from typing import Iterator, List, Set
+import numpy as np
 import random
 import math
+import sys
 
 
 class HistoryHandler:
@@ -9,9 +13,68 @@ class HistoryHandler:
     Creates the histories from the text file and converts the histories into feature vectors
     """
 
-    def __init__(self, file_path: str, window_size: int):
-        self.text_editor = TextEditor(file_path, window_size)
+    def __init__(self, file_path: str, window_size: int, use_store: bool = False, cache_directory: str = "cache"):
+        """
+        Create a HistoryHandler object
+
+        :param file_path: The path to the file of word_tag pairs
+        :param window_size: The number of words in a history
+        :param use_store: If True, creates the histories from an integer-encoded store of the file (see CorpusStore),
+                          and the text editor (which holds all of the lines as strings) is created only if used
+        :param cache_directory: The directory to keep the store in
+        """
+        self.file_path = file_path
         self.history_length = window_size
+        self._text_editor = None
+
+        self.corpus_store = None
+        if use_store:
+            self.corpus_store = CorpusStore.open(file_path, TextEditor.start, TextEditor.end, cache_directory)
+        else:
+            self._text_editor = TextEditor(file_path, window_size)
+
+    @property
+    def text_editor(self) -> "TextEditor":
+        if self._text_editor is None:
+            self._text_editor = TextEditor(self.file_path, self.history_length)
+        return self._text_editor
+
+    @property
+    def tags(self) -> Set[str]:
+        """
+        The tags of the text (with the start and the end symbols)
+        """
+        if self.corpus_store is not None:
+            return set(self.corpus_store.tag_list)
+        return self.text_editor.tags
+
+    @property
+    def words(self) -> Set[str]:
+        """
+        The words of the text (with the start and the end symbols)
+        """
+        if self.corpus_store is not None:
+            return set(self.corpus_store.word_list)
+        return self.text_editor.words
+
+    def iter_histories(self) -> Iterator[History]:
+        """
+        Iterate over all of the histories (from the store, only a chunk of sentences is in memory at a time)
+        """
+        if self.corpus_store is not None:
+            return self.corpus_store.iter_histories(self.history_length)
+        return iter(self.create_histories(None, "ALL"))
+
+    def line_offsets(self) -> np.ndarray:
+        """
+        :return: The index of the first history of each line (and the number of histories at the end)
+        """
+        if self.corpus_store is not None:
+            return np.array(self.corpus_store.offsets)
+
+        # Each line has a history for each word (the padding symbols are not histories)
+        line_lengths = [len(line.split(" ")) - self.history_length for line in self.text_editor.decorated_lines]
+        return np.concatenate([[0], np.cumsum(line_lengths)])
 
     def create_histories(self, max_number: int = None, style: str = "ALL", **kwargs) -> List[History]:
         """
@@ -28,6 +91,14 @@ class HistoryHandler:
                         In any other case, ignores the kwargs
         :return: yields the histories from the read lines
         """
+        with instrumentation.stage("create_histories"):
+            histories = self._create_histories(max_number, style, **kwargs)
+        instrumentation.count("histories_created", len(histories))
+        return histories
+
+    def _create_histories(self, max_number: int = None, style: str = "ALL", **kwargs) -> List[History]:
+        if self.corpus_store is not None:
+            return self.corpus_store.histories(self.history_length, max_number, style, **kwargs)
 
         def to_histories(lines: List[str]) -> List[History]:
             histories = []
@@ -36,7 +107,7 @@ class HistoryHandler:
 
                 k_grams = zip(*[split_words[i:] for i in range(self.history_length + 1)])
                 for k_gram in k_grams:
-                    split_list = (word_tag.split("_") for word_tag in k_gram)
+                    split_list = (map(sys.intern, word_tag.split("_")) for word_tag in k_gram)
                     words, tags = zip(*split_list)
                     histories.append(History(words[:-1], tags[:-1], tuple([words[-1]])))
             return histories
@@ -63,15 +134,15 @@ class TextEditor:
     Adds start and end symbols for the line od the text
     """
 
+    # Special symbols for the beginning and ending of the line
+    start = "┻━┻"
+    end = "┬─┬"
+
     def __init__(self, file_path: str, window_size: int):
         self.file_path = file_path
         self.window_size = window_size
         self.text_size = 0
 
-        # Special symbols for the beginning and ending of the line
-        self.start = "┻━┻"
-        self.end = "┬─┬"
-
         self.delimiters = ["_", " "]
 
         # Remove any delimiter (just in case)
@@ -2,6 +2,8 @@ from typing import Tuple, Union
 
 
 class Key:
+    __slots__ = ("words", "tags", "next_words", "threshold")
+
     def __init__(self, words: Tuple[str, ...], tags: Tuple[str, ...], threshold: int,
                  next_words: Tuple[str, ...] = tuple()):
         self.words = words
@@ -18,7 +20,8 @@ class Key:
         return False
 
     def __hash__(self):
-        return hash(self.words) ^ hash(self.tags) ^ hash(self.next_words)
+        # Combines the parts in order (XOR would collide when the parts are swapped or equal)
+        return hash((self.words, self.tags, self.next_words))
 
     def __repr__(self):
         return f"words: {self.words}, tags: {self.tags}, threshold: {self.threshold}, next words: {self.next_words}"
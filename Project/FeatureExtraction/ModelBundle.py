@@ -0,0 +1,292 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import numpy as np
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from ..FeatureExtraction.Key import Key
+
+_fnv_offset = 0xCBF29CE484222325
+_fnv_prime = 0x100000001B3
+_mask_64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _hash_rows(rows: np.ndarray) -> np.ndarray:
+    """
+    A stable (FNV-1a) hash of each row of string-IDs
+    """
+    hashes = np.full(len(rows), _fnv_offset, dtype=np.uint64)
+    for column in rows.T:
+        hashes ^= column.astype(np.int64).astype(np.uint64) & np.uint64(0xFFFFFFFF)
+        hashes *= np.uint64(_fnv_prime)
+    return hashes
+
+
+def _hash_row(row: List[int]) -> int:
+    """
+    The same hash as _hash_rows, for a single row (in pure python)
+    """
+    value = _fnv_offset
+    for string_id in row:
+        value = ((value ^ (string_id & 0xFFFFFFFF)) * _fnv_prime) & _mask_64
+    return value
+
+
+class ModelBundle:
+    """
+    A model (the features and the weights) in a single versioned binary file, which is loaded memory-mapped \n
+    The file is a header (magic, version and a json description of the sections) followed by the sections:
+    the strings of the keys, the key table (the string-IDs of the parts of the key of each feature, in the order of
+    the feature IDs), an open-addressing hash index over the key table and the weights. \n
+    A model in the feature-hashing mode has no keys, its header holds the parameters of its features instead
+    (see HashedFeatures.parameters)
+    """
+
+    magic = b"MEMMODEL"
+    version = 1
+    alignment = 64
+
+    def __init__(self, path: str):
+        """
+        Open a bundle (see write), only the header is read, the sections are mapped
+
+        :param path: The path to the bundle file
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_length = struct.unpack_from("<8sII", self._buffer, 0)
+        if magic != ModelBundle.magic:
+            raise ValueError(f"{path} is not a model bundle")
+        if version > ModelBundle.version:
+            raise ValueError(f"The version of {path} ({version}) is newer than the supported one ({ModelBundle.version})")
+        self.header = json.loads(bytes(self._buffer[16:16 + header_length]))
+        self.widths = tuple(self.header["widths"])  # type: Tuple[int, int, int]
+
+        sections = {name: np.ndarray(tuple(shape), dtype=dtype, buffer=self._buffer, offset=offset)
+                    for name, (offset, dtype, shape) in self.header["sections"].items()}
+        self.string_data = sections["string_data"]
+        self.string_offsets = sections["string_offsets"]
+        self.parts = sections["parts"]
+        self.hashes = sections["hashes"]
+        self.index = sections["index"]
+        self.weights = sections["weights"]
+        self.hashed = self.header.get("hashed")  # type: Optional[Dict[str, Any]]
+        self._strings = None  # type: Optional[List[str]]
+        self._string_ids = None  # type: Optional[Dict[str, int]]
+
+    @staticmethod
+    def is_bundle(path: str) -> bool:
+        with open(path, "rb") as file:
+            return file.read(len(ModelBundle.magic)) == ModelBundle.magic
+
+    @property
+    def number_of_features(self) -> int:
+        return len(self.parts)
+
+    @property
+    def strings(self) -> List[str]:
+        """
+        The words and the tags of the keys (decoded on first use)
+        """
+        if self._strings is None:
+            data = self.string_data.tobytes()
+            offsets = self.string_offsets.tolist()
+            self._strings = [sys.intern(data[start:end].decode()) for start, end in zip(offsets[:-1], offsets[1:])]
+            self._string_ids = {string: index for index, string in enumerate(self._strings)}
+        return self._strings
+
+    # <editor-fold desc="Keys">
+    def key_row(self, key: Key) -> Optional[List[int]]:
+        """
+        Get the row of the key in the key table (the string-IDs of its parts, padded with -1)
+
+        :return: The row, or None if one of the strings of the key is not in the bundle
+        """
+        if self._string_ids is None:
+            _ = self.strings
+        row = []
+        for part, width in zip((key.words, key.tags, key.next_words), self.widths):
+            if len(part) > width:
+                return None
+            for string in part:
+                string_id = self._string_ids.get(string)
+                if string_id is None:
+                    return None
+                row.append(string_id)
+            row.extend([-1] * (width - len(part)))
+        return row
+
+    def find(self, key: Key) -> Optional[int]:
+        """
+        Find the feature ID of the given key using the hash index
+
+        :return: The feature ID, or None if the key is not a feature
+        """
+        row = self.key_row(key)
+        if row is None:
+            return None
+        value = _hash_row(row)
+        mask = len(self.index) - 1
+        slot = value & mask
+        while True:
+            feature = int(self.index[slot])
+            if feature < 0:
+                return None
+            if int(self.hashes[feature]) == value and self.parts[feature].tolist() == row:
+                return feature
+            slot = (slot + 1) & mask
+
+    def key_parts(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The key table split into the string-IDs of the words, the tags and the next words of each feature
+        (each part is padded with -1 at its end), without decoding the keys
+        """
+        words_end, tags_end = self.widths[0], self.widths[0] + self.widths[1]
+        return self.parts[:, :words_end], self.parts[:, words_end:tags_end], self.parts[:, tags_end:]
+
+    def string_ids(self, strings: Iterable[str]) -> np.ndarray:
+        """
+        :return: The string-ID of each of the given strings, or -1 for a string which is not in the bundle
+        """
+        if self._string_ids is None:
+            _ = self.strings
+        return np.array([self._string_ids.get(string, -1) for string in strings], dtype=np.int32)
+
+    def decode(self, string_ids: Iterable[int]) -> Tuple[str, ...]:
+        """
+        :return: The strings of the given string-IDs (skipping the padding)
+        """
+        strings = self.strings
+        return tuple(strings[i] for i in string_ids if i >= 0)
+
+    def keys(self) -> Iterator[Key]:
+        """
+        Decode the keys, in the order of the feature IDs
+        """
+        strings = self.strings
+        words_end, tags_end = self.widths[0], self.widths[0] + self.widths[1]
+        for row in self.parts.tolist():
+            yield Key(tuple(strings[i] for i in row[:words_end] if i >= 0),
+                      tuple(strings[i] for i in row[words_end:tags_end] if i >= 0), 1,
+                      tuple(strings[i] for i in row[tags_end:] if i >= 0))
+
+    # </editor-fold>
+
+    @staticmethod
+    def write(path: str, features_dict: Dict[Key, int], weights: np.ndarray,
+              hashed: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Write a bundle \n
+        The bundle is written to a temporary file which then replaces the path, so a bundle which is mapped
+        (possibly the one being replaced) stays valid, and an interrupted write leaves no partial bundle
+
+        :param path: The path to the bundle file
+        :param features_dict: The features (the IDs are expected to be 0, ..., number of features - 1)
+        :param weights: The weights vector
+        :param hashed: The parameters of the features of a model in the feature-hashing mode
+                       (which has no keys, see HashedFeatures.parameters)
+        """
+        keys = sorted(features_dict, key=features_dict.get)
+        widths = (max((len(key.words) for key in keys), default=0),
+                  max((len(key.tags) for key in keys), default=0),
+                  max((len(key.next_words) for key in keys), default=0))
+
+        string_ids = dict()  # type: Dict[str, int]
+        parts = np.full((len(keys), sum(widths)), -1, dtype=np.int32)
+        for row, key in enumerate(keys):
+            column = 0
+            for part, width in zip((key.words, key.tags, key.next_words), widths):
+                parts[row, column:column + len(part)] = [string_ids.setdefault(string, len(string_ids))
+                                                         for string in part]
+                column += width
+
+        encoded = [string.encode() for string in string_ids]
+        string_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        string_offsets[1:] = np.cumsum([len(string) for string in encoded])
+        string_data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        # Open addressing (linear probing) with a load factor of at most 1/2
+        hashes = _hash_rows(parts)
+        index = np.full(1 << max(1, 2 * len(keys) - 1).bit_length(), -1, dtype=np.int32)
+        mask = len(index) - 1
+        for feature, value in enumerate(hashes.tolist()):
+            slot = value & mask
+            while index[slot] >= 0:
+                slot = (slot + 1) & mask
+            index[slot] = feature
+
+        arrays = {"string_data": string_data, "string_offsets": string_offsets, "parts": parts, "hashes": hashes,
+                  "index": index, "weights": np.ascontiguousarray(weights)}
+
+        # The header describes the offset, the type and the shape of each (aligned) section
+        sections = dict()
+        header_length = 4096
+        offset = 16 + header_length
+        for name, array in arrays.items():
+            offset += -offset % ModelBundle.alignment
+            sections[name] = (offset, array.dtype.str, list(array.shape))
+            offset += array.nbytes
+        header = {"widths": widths, "sections": sections}
+        if hashed is not None:
+            header["hashed"] = hashed
+        header = json.dumps(header).encode()
+        if len(header) > header_length:
+            raise ValueError("The header of the bundle is too long")
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(struct.pack("<8sII", ModelBundle.magic, ModelBundle.version, len(header)))
+            file.write(header)
+            for name, array in arrays.items():
+                file.seek(sections[name][0])
+                file.write(array.tobytes())
+        os.replace(temporary_path, path)
+
+
+class BundleFeatures(Mapping):
+    """
+    The features dictionary of a bundle (from a key to its feature ID) \n
+    Single keys are found through the hash index, iterating decodes all of the keys once
+    (and from then on a regular dictionary is used). The tables of the decoder (see ScoreTables and ObservationIndex)
+    are built from the key table of the bundle, and do not iterate
+    """
+
+    def __init__(self, bundle: ModelBundle):
+        self.bundle = bundle
+        self._dictionary = None  # type: Optional[Dict[Key, int]]
+
+    def _materialize(self) -> Dict[Key, int]:
+        if self._dictionary is None:
+            self._dictionary = {key: feature for feature, key in enumerate(self.bundle.keys())}
+        return self._dictionary
+
+    def get(self, key: Key, default: Optional[int] = None) -> Optional[int]:
+        if self._dictionary is not None:
+            return self._dictionary.get(key, default)
+        feature = self.bundle.find(key)
+        return default if feature is None else feature
+
+    def __getitem__(self, key: Key) -> int:
+        feature = self.get(key)
+        if feature is None:
+            raise KeyError(key)
+        return feature
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self) -> Iterator[Key]:
+        return iter(self._materialize())
+
+    def __len__(self) -> int:
+        return self.bundle.number_of_features
+
+    def items(self):
+        return self._materialize().items()
+
+    def values(self):
+        return self._materialize().values()
@@ -0,0 +1,94 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List
+from ..FeatureExtraction.History import History
+from ..FeatureExtraction.Key import Key
+from ..FeatureExtraction.ModelBundle import BundleFeatures, ModelBundle
+from ..Profiling import instrumentation
+
+
+class ObservationIndex:
+    """
+    Caches the observation features of each word (the features that depend only on the current word) \n
+    The observations of a word are computed once, and are expanded to the (observation, tag) feature ids by lookup
+    """
+
+    def __init__(self, features_dict: Dict[Key, int],
+                 observation_functions: List[Callable[[History], Iterable[Key]]], max_size: int = 10000):
+        """
+        Create an ObservationIndex object
+
+        :param features_dict: The features dictionary (from key to feature id)
+        :param observation_functions: The feature functions that depend only on the current word and tag
+        :param max_size: The maximal number of cached words that are not in the vocabulary
+        """
+        self.observation_functions = observation_functions
+        self.max_size = max_size
+
+        # From an observation to the feature id of each tag
+        self.table = dict()
+        if isinstance(features_dict, BundleFeatures):
+            self._bundle_table(features_dict.bundle)
+        else:
+            for key, feature in features_dict.items():
+                if len(key.words) == 1 and len(key.tags) == 1 and not key.next_words:
+                    self.table.setdefault(key.words[0], dict())[key.tags[0]] = feature
+
+        self.vocabulary = dict()  # Words which are kept permanently
+        self.recent = OrderedDict()  # Least recently used words (bounded by max_size)
+
+    def _bundle_table(self, bundle: ModelBundle) -> None:
+        """
+        Fill the table from the key table of a model bundle (without decoding all of the keys)
+        """
+        words, tags, next_words = bundle.key_parts()
+        observations = ((words >= 0).sum(axis=1) == 1) & ((tags >= 0).sum(axis=1) == 1) & (next_words < 0).all(axis=1)
+        strings = bundle.strings
+        for feature, word, tag in zip(np.flatnonzero(observations).tolist(), words[observations, 0].tolist(),
+                                      tags[observations, 0].tolist()):
+            self.table.setdefault(strings[word], dict())[strings[tag]] = feature
+
+    def precompute(self, words: Iterable[str]) -> None:
+        """
+        Compute the observations of the given words and keep them permanently
+
+        :param words: The words to add to the vocabulary
+        """
+        for word in words:
+            if word not in self.vocabulary:
+                self.vocabulary[word] = self.recent.pop(word, None) or self._observations(word)
+
+    def lookup(self, word: str, tag: str) -> List[int]:
+        """
+        Get the ids of the observation features of the given word with the given tag
+
+        :param word: The current word
+        :param tag: The current tag
+        :return: The feature ids
+        """
+        observations = self.vocabulary.get(word)
+        if observations is None:
+            observations = self.recent.get(word)
+            if observations is None:
+                instrumentation.count("observation_cache_misses")
+                observations = self._observations(word)
+                self.recent[word] = observations
+                if self.max_size < len(self.recent):
+                    self.recent.popitem(last=False)
+            else:
+                self.recent.move_to_end(word)
+                if instrumentation.enabled:
+                    instrumentation.count("observation_cache_hits")
+        elif instrumentation.enabled:
+            instrumentation.count("observation_cache_hits")
+        return [tag_features[tag] for tag_features in observations if tag in tag_features]
+
+    def _observations(self, word: str) -> List[Dict[str, int]]:
+        history = History((word,), (None,))
+        observations = []
+        for func in self.observation_functions:
+            for key in func(history):
+                tag_features = self.table.get(key.words[0])
+                if tag_features is not None:
+                    observations.append(tag_features)
+        return observations
@@ -0,0 +1,97 @@
+from collections import Counter
+from typing import Dict, Tuple
+from ..FeatureExtraction.HistoryHandler import TextEditor
+
+
+class TagDictionary:
+    """
+    Holds the tags each word may take, in order to prune the candidate tags during inference \n
+    Frequent words may take only the tags they took in the text, rare and unknown words use the tags of their suffix
+    """
+
+    def __init__(self, text_editor: TextEditor, min_count: int = 5, max_suffix_length: int = 4,
+                 min_suffix_count: int = 20, min_tag_ratio: float = 0.01):
+        """
+        Create a TagDictionary object
+
+        :param text_editor: The text to count the tags of the words from
+        :param min_count: The minimal number of occurrences of a word to trust its own tags
+        :param max_suffix_length: The maximal length of a suffix
+        :param min_suffix_count: The minimal number of occurrences of a suffix to use its tags
+        :param min_tag_ratio: The minimal ratio of a tag among the occurrences of a suffix to allow the tag
+        """
+        self.max_suffix_length = max_suffix_length
+        self.min_suffix_count = min_suffix_count
+        self.min_tag_ratio = min_tag_ratio
+
+        special_symbols = (text_editor.start, text_editor.end)
+        self.all_tags = tuple(sorted(text_editor.tags.difference(special_symbols)))
+
+        # Count the distinct word_tag pairs first, the suffixes are counted once per pair
+        pair_counts = Counter(word_tag for line in text_editor.decorated_lines for word_tag in line.split(" "))
+
+        word_tags = dict()  # type: Dict[str, Counter]
+        self.suffix_tags = dict()  # type: Dict[str, Counter]
+        for word_tag, count in pair_counts.items():
+            word, tag = word_tag.split("_")
+            if tag in special_symbols:
+                continue
+            word_tags.setdefault(word, Counter())[tag] += count
+            for suffix_length in range(1, min(len(word), max_suffix_length) + 1):
+                self.suffix_tags.setdefault(word[-suffix_length:], Counter())[tag] += count
+
+        # The frequent words may take only their own tags
+        self.known = {word: tuple(sorted(tags)) for word, tags in word_tags.items() if min_count <= sum(tags.values())}
+
+        # The rare words may take their own tags and the tags of their suffix
+        self.rare = {word: tuple(sorted(set(tags).union(self.suffix_candidates(word))))
+                     for word, tags in word_tags.items() if word not in self.known}
+
+    def candidates(self, word: str) -> Tuple[str, ...]:
+        """
+        Get the tags the given word may take
+
+        :param word: The word
+        :return: The candidate tags
+        """
+        tags = self.known.get(word)
+        if tags is None:
+            tags = self.rare.get(word)
+            if tags is None:
+                tags = self.suffix_candidates(word)
+        return tags
+
+    def suffix_candidates(self, word: str) -> Tuple[str, ...]:
+        """
+        Get the tags of the longest suffix of the word that is frequent enough
+
+        :param word: The word
+        :return: The candidate tags (all of the tags if there is no such suffix)
+        """
+        for suffix_length in range(min(len(word), self.max_suffix_length), 0, -1):
+            tags = self.suffix_tags.get(word[-suffix_length:])
+            if tags is not None:
+                total = sum(tags.values())
+                if self.min_suffix_count <= total:
+                    return tuple(sorted(tag for tag, count in tags.items() if self.min_tag_ratio * total <= count))
+        return self.all_tags
+
+    def coverage(self, file_path: str) -> Tuple[float, float]:
+        """
+        Measure the quality of the pruning over a tagged file
+
+        :param file_path: The path to a file of word_tag pairs
+        :return: The rate of the words whose real tag is a candidate, and the mean number of candidates per word
+        """
+        covered = 0
+        candidates_counter = 0
+        counter = 0
+        with open(file_path) as file:
+            for line in file:
+                for word_tag in line.strip("\n").split(" "):
+                    word, tag = word_tag.split("_")
+                    tags = self.candidates(word)
+                    covered += tag in tags
+                    candidates_counter += len(tags)
+                    counter += 1
+        return covered / max(1, counter), candidates_counter / max(1, counter)
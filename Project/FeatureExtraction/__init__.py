@@ -1,5 +1,12 @@
 from ..FeatureExtraction.Key import Key
 from ..FeatureExtraction.History import History
 from ..FeatureExtraction.FeatureStatistics import FeatureStatistics
+from ..FeatureExtraction.ObservationIndex import ObservationIndex
+from ..FeatureExtraction.ModelBundle import ModelBundle
+from ..FeatureExtraction.HashedFeatures import HashedFeatures
 from ..FeatureExtraction.FeatureID import FeatureID
+from ..FeatureExtraction.FeatureCounts import FeatureCounts
+from ..FeatureExtraction.CorpusStore import CorpusStore
 from ..FeatureExtraction.HistoryHandler import HistoryHandler
+from ..FeatureExtraction.TagDictionary import TagDictionary
+from ..FeatureExtraction.FactoredFeatures import FactoredFeatures
@@ -0,0 +1,161 @@
+import json
+import time
+import numpy as np
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from ..Inference.Inference import Inference
+
+
+class Evaluation:
+    """
+    Evaluates a model over a file of word_tag pairs \n
+    The tags are integer-encoded, the confusion matrix is accumulated with np.add.at and the report (accuracy,
+    per-tag precision/recall/F1, throughput and decode latencies by sentence length) is a json-compatible dict
+    """
+
+    length_bounds = (10, 20, 30, 40)  # The upper bounds of the sentence length groups of the latencies
+    percentiles = (50, 90, 99)
+
+    def __init__(self, inference: Inference, beam_size: Optional[int] = 5, margin: Optional[float] = None):
+        """
+        Create an Evaluation object
+
+        :param inference: The (loaded) model to evaluate
+        :param beam_size: The width of the beam (see Inference.infer)
+        :param margin: The margin of the adaptive beam (see Inference.infer)
+        """
+        self.inference = inference
+        self.beam_size = beam_size
+        self.margin = margin
+
+        # The tags of the model, tags which appear only in the evaluated file are appended
+        self.tag_list = [tag for tag in inference.tag_list
+                         if tag not in (inference.start_symbol, inference.end_symbol)]
+        self.tag_index = {tag: index for index, tag in enumerate(self.tag_list)}
+
+    @staticmethod
+    def read_tagged(path: str) -> Iterator[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+        """
+        Read a file of word_tag pairs, one sentence at a time
+
+        :param path: The path to the file
+        :return: yields the words and the tags of each sentence
+        """
+        with open(path) as file:
+            for line in file:
+                line = line.rstrip("\r\n")
+                if line:
+                    words, tags = zip(*(word_tag.split("_") for word_tag in line.split(" ")))
+                    yield words, tags
+
+    def _encode(self, tags: Sequence[str]) -> List[int]:
+        indices = []
+        for tag in tags:
+            index = self.tag_index.get(tag)
+            if index is None:
+                index = self.tag_index[tag] = len(self.tag_list)
+                self.tag_list.append(tag)
+            indices.append(index)
+        return indices
+
+    def evaluate(self, path: str, max_sentences: int = None) -> Dict[str, Any]:
+        """
+        Tag the sentences of the file and compare with the real tags
+
+        :param path: The path to a file of word_tag pairs
+        :param max_sentences: The maximal number of sentences to evaluate (if None, evaluates the whole file)
+        :return: The report (see report)
+        """
+        real, predicted = [], []
+        lengths, latencies = [], []
+        start = time.perf_counter()
+        for counter, (words, tags) in enumerate(self.read_tagged(path)):
+            if max_sentences is not None and max_sentences <= counter:
+                break
+            sentence_start = time.perf_counter()
+            predicted_tags = self.inference.infer(words, self.beam_size, margin=self.margin)
+            latencies.append(time.perf_counter() - sentence_start)
+            lengths.append(len(words))
+            real.extend(self._encode(tags))
+            predicted.extend(self._encode(predicted_tags))
+        elapsed = time.perf_counter() - start
+
+        return self.report(np.array(real, dtype=np.int64), np.array(predicted, dtype=np.int64),
+                           np.array(lengths, dtype=np.int64), np.array(latencies), elapsed)
+
+    # <editor-fold desc="Report">
+    def confusion_matrix(self, real: np.ndarray, predicted: np.ndarray) -> np.ndarray:
+        """
+        :return: The confusion matrix, the rows are the real tags and the columns are the predicted tags
+        """
+        matrix = np.zeros((len(self.tag_list), len(self.tag_list)), dtype=np.int64)
+        np.add.at(matrix, (real, predicted), 1)
+        return matrix
+
+    def tag_metrics(self, matrix: np.ndarray) -> Dict[str, Dict[str, float]]:
+        """
+        :return: The precision, the recall, the F1 score and the support of each tag which appears in the file
+                 (as a real tag or a predicted one)
+        """
+        true_positives = np.diag(matrix).astype(np.float64)
+        support = matrix.sum(axis=1)
+        predicted_counts = matrix.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = np.nan_to_num(true_positives / predicted_counts)
+            recall = np.nan_to_num(true_positives / support)
+            f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+
+        return {tag: {"precision": float(precision[index]), "recall": float(recall[index]),
+                      "f1": float(f1[index]), "support": int(support[index])}
+                for index, tag in enumerate(self.tag_list) if support[index] or predicted_counts[index]}
+
+    def latency_percentiles(self, lengths: np.ndarray, latencies: np.ndarray) -> Dict[str, Dict[str, float]]:
+        """
+        :return: The percentiles of the decode latency (in milliseconds) of each group of sentence lengths
+        """
+        groups = np.searchsorted(self.length_bounds, lengths)
+        names = [f"{lower + 1}-{upper}" for lower, upper in zip((0, *self.length_bounds[:-1]), self.length_bounds)]
+        names.append(f">{self.length_bounds[-1]}")
+
+        result = dict()
+        for group, name in enumerate(names):
+            group_latencies = latencies[groups == group] * 1000
+            if len(group_latencies):
+                result[name] = {"sentences": int(len(group_latencies)),
+                                **{f"p{percentile}_ms": float(value) for percentile, value in
+                                   zip(self.percentiles, np.percentile(group_latencies, self.percentiles))}}
+        return result
+
+    def report(self, real: np.ndarray, predicted: np.ndarray, lengths: np.ndarray, latencies: np.ndarray,
+               elapsed: float) -> Dict[str, Any]:
+        """
+        Create the report of an evaluation
+
+        :param real: The indices of the real tags (of all of the words)
+        :param predicted: The indices of the predicted tags
+        :param lengths: The length of each sentence
+        :param latencies: The decode time (in seconds) of each sentence
+        :param elapsed: The total time (in seconds)
+        :return: The report
+        """
+        matrix = self.confusion_matrix(real, predicted)
+        tag_metrics = self.tag_metrics(matrix)
+        return {
+            "beam_size": self.beam_size,
+            "margin": self.margin,
+            "sentences": int(len(lengths)),
+            "tokens": int(len(real)),
+            "accuracy": float(np.mean(real == predicted)) if len(real) else 0.0,
+            "macro_f1": float(np.mean([metrics["f1"] for metrics in tag_metrics.values()])) if tag_metrics else 0.0,
+            "tokens_per_sec": len(real) / elapsed if elapsed else 0.0,
+            "sentences_per_sec": len(lengths) / elapsed if elapsed else 0.0,
+            "latency_by_length": self.latency_percentiles(lengths, latencies),
+            "tags": tag_metrics,
+            "confusion_matrix": {"tags": self.tag_list, "counts": matrix.tolist()},
+        }
+
+    @staticmethod
+    def save_json(report: Dict[str, Any], path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+
+    # </editor-fold>
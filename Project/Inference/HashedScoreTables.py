@@ -0,0 +1,85 @@
+import itertools
+import numpy as np
+from typing import List, Tuple
+from ..FeatureExtraction import History, FeatureID
+from ..Profiling import instrumentation
+
+
+class HashedScoreTables:
+    """
+    The score tables (see ScoreTables) of the feature-hashing mode (see HashedFeatures) \n
+    The weights are a table of (observation bucket, tag), so the score of a state with every tag is a row of the table.
+    The transition tables (the tag-only observations) are computed once when the model is loaded,
+    the word-conditioned observations are hashed only for the states of the beam
+    """
+
+    def __init__(self, feature_id: FeatureID, weights: np.ndarray, tags: List[str], history_length: int):
+        """
+        Create a HashedScoreTables object
+
+        :param feature_id: The features of the model (in the feature-hashing mode)
+        :param weights: The weights of the model
+        :param tags: The tags, the position of a tag in the list is its index in the tables
+        :param history_length: The number of words in a history
+        """
+        self.feature_id = feature_id
+        self.hashed = feature_id.features_dict
+        self.history_length = history_length
+        self.tags = list(tags)
+        self.number_of_tags = len(tags)
+
+        # The weights by observation bucket, with a column per tag (the tags without features have no weights)
+        columns = [index for index, tag in enumerate(self.tags) if tag in self.hashed.tag_index]
+        self.weights = np.zeros((self.hashed.number_of_observations, self.number_of_tags))
+        self.weights[:, columns] = np.asarray(weights).reshape(self.hashed.number_of_observations, -1)[
+            :, [self.hashed.tag_index[self.tags[column]] for column in columns]]
+
+        # transitions[length - 1] is a dense table over the last length tags (of shape number_of_tags ** length)
+        self.transitions = []
+        for length in range(1, history_length + 1):
+            previous_tags = itertools.product(self.tags, repeat=length - 1)
+            rows, signs = zip(*(self.hashed.observation_bucket((tuple(), tuple(), tags)) for tags in previous_tags))
+            transition = self.weights[list(rows)] * np.array(signs)[:, np.newaxis]
+            self.transitions.append(transition.reshape((self.number_of_tags,) * length))
+
+    def emission_entries(self, history_words: Tuple[str, ...], next_words: Tuple[str, ...]) \
+            -> List[Tuple[Tuple[str, ...], Tuple[str, ...], int]]:
+        """
+        Collect the word-conditioned observations that may be active at a position
+
+        :param history_words: The words of the history at the position
+        :param next_words: The next words after the history
+        :return: The words, the next words and the number of tags of each observation
+        """
+        history = History(history_words, (None,) * len(history_words), next_words)
+        contexts = {(key.words, key.next_words, len(key.tags))
+                    for key in self.feature_id.feature_statistics.get_keys(history) if key.words or key.next_words}
+        if instrumentation.enabled:
+            instrumentation.count("feature_lookups", len(contexts))
+        return list(contexts)
+
+    def scores(self, entries: List[Tuple[Tuple[str, ...], Tuple[str, ...], int]], states: np.ndarray) -> np.ndarray:
+        """
+        Calculate the linear score of each state followed by each tag
+
+        :param entries: The observations of the position (see emission_entries)
+        :param states: The previous (history_length - 1) tags of each state, as an array of tag indices
+        :return: An array of shape (number of states, number of tags)
+        """
+        scores = np.zeros((len(states), self.number_of_tags))
+        for length, transition in enumerate(self.transitions, start=1):
+            scores += transition[tuple(states[:, states.shape[1] - length + 1:].T)]
+
+        observation_bucket = self.hashed.observation_bucket
+        for words, next_words, length in entries:
+            if length == 1:
+                row, sign = observation_bucket((words, next_words, tuple()))
+                scores += sign * self.weights[row]
+                continue
+
+            # Hash the observation of each distinct previous tags once
+            previous_tags, inverse = np.unique(states[:, states.shape[1] - length + 1:], axis=0, return_inverse=True)
+            rows, signs = zip(*(observation_bucket((words, next_words, tuple(self.tags[tag] for tag in tags)))
+                                for tags in previous_tags.tolist()))
+            scores += (self.weights[list(rows)] * np.array(signs)[:, np.newaxis])[inverse.reshape(-1)]
+        return scores
@@ -1,7 +1,9 @@
 import numpy as np
-import scipy.sparse as sp
-from typing import Tuple, List
-from ..FeatureExtraction import History, FeatureID, HistoryHandler
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from ..FeatureExtraction import History, FeatureID, HistoryHandler, TagDictionary
+from ..Inference.HashedScoreTables import HashedScoreTables
+from ..Inference.ScoreTables import ScoreTables
+from ..Profiling import instrumentation
 
 
 class Inference:
@@ -9,84 +11,273 @@ class Inference:
     Responsible to infer the tags of a sentence after training
     """
 
-    def __init__(self, feature_id: FeatureID, weights: np.ndarray, history_handler: HistoryHandler):
+    def __init__(self, feature_id: FeatureID, weights: np.ndarray, history_handler: HistoryHandler,
+                 tag_dictionary: TagDictionary = None, precompute: bool = True):
+        """
+        Create an Inference object
+
+        :param feature_id: The features of the model
+        :param weights: The weights of the model
+        :param history_handler: The history handler of the text the model was trained on
+        :param tag_dictionary: If given, scores only the candidate tags of each word
+        :param precompute: If True, computes the observations of all of the known words in advance
+                           (otherwise they are computed on first use, which starts faster)
+        """
         self.feature_id = feature_id
         self.weights = weights
+        self.tag_dictionary = tag_dictionary
 
         self.tags = history_handler.text_editor.tags
         self.start_symbol = history_handler.text_editor.start
         self.end_symbol = history_handler.text_editor.end
 
         self.history_length = history_handler.history_length
+        self.beam_widths = []  # The number of states kept at each position of the last sentence (beam search)
+
+        # Keep the observations of the known words permanently (unseen words are cached with LRU eviction)
+        if precompute and not feature_id.hashed_features:
+            self.feature_id.observation_index.precompute(history_handler.text_editor.words)
 
-    def infer(self, words: Tuple[str, ...], beam_size: int = 5) -> List[str]:
+        # Integer encoding of the tags (the beam is kept as arrays of tag indices)
+        self.tag_list = sorted(self.tags)
+        self.tag_index = {tag: index for index, tag in enumerate(self.tag_list)}
+        self.normal_tag_indices = np.array([self.tag_index[tag] for tag in self.tag_list
+                                            if tag not in (self.start_symbol, self.end_symbol)])
+        self.end_tag_indices = np.array([self.tag_index[self.end_symbol]])
+
+        # Materialize the transition tables and the emission entries of the features
+        # (in the feature-hashing mode there are no keys to materialize, the states are scored by their observations)
+        if feature_id.hashed_features:
+            self.score_tables = HashedScoreTables(feature_id, weights, self.tag_list, self.history_length)
+        else:
+            self.score_tables = ScoreTables(feature_id, weights, self.tag_list, self.history_length)
+
+    def _score_histories(self, histories: List[History]) -> np.ndarray:
         """
-        Infer the tags of the given words using Viterbi (beam search) algorithm
+        Calculate the linear score of each of the given histories with a single sparse product
+
+        :param histories: The histories to score
+        :return: The scores of the histories (in the same order)
+        """
+        return self.feature_id.histories_to_csr(histories) @ self.weights
+
+    def _positions(self, words: Tuple[str, ...]) -> Iterator[Tuple[Tuple[str, ...], Tuple[str, ...], np.ndarray]]:
+        """
+        Iterate over the positions of the sentence
 
         :param words: The words in the sentence
-        :param beam_size: The width of the beam
-        :return: The predicted tags as a list
+        :return: yields the words of the history, the next words and the indices of the possible tags
         """
         # Add padding symbols
         words = [self.start_symbol] * (self.history_length - 1) + [*words] + [self.end_symbol] * 2
         sentence_length = len(words) - 1
 
-        normal_tags = list(self.tags.difference([self.start_symbol, self.end_symbol]))
-
-        # Initialize the probability for the base case
-        prev_probability = {tuple([self.start_symbol] * (self.history_length - 1)): 1}
-        cur_probability = dict()
-        back_pointers = []
-
         # Iterate over the histories in the sentence
         for index, all_words in enumerate(zip(*[words[i:] for i in range(self.history_length + 1)])):
-            history_words = all_words[:-1]
-            next_word = all_words[-1]
-            back_pointers.append(dict())
-
             # Check if this is the end of the sentence
             if index < sentence_length - self.history_length:
-                relevant_closer_tags = normal_tags
+                if self.tag_dictionary is None:
+                    closer_tags = self.normal_tag_indices
+                else:
+                    closer_tags = np.array([self.tag_index[tag]
+                                            for tag in self.tag_dictionary.candidates(all_words[-2])])
+            else:
+                closer_tags = self.end_tag_indices
+            yield all_words[:-1], tuple([all_words[-1]]), closer_tags
+
+    def _log_probabilities(self, history_words: Tuple[str, ...], next_words: Tuple[str, ...], states: np.ndarray,
+                           closer_tags: np.ndarray, factored: bool) -> np.ndarray:
+        """
+        Calculate the log-probability of each closer tag given each state
+
+        :param history_words: The words of the history
+        :param next_words: The next words after the history
+        :param states: The previous (history_length - 1) tags of each state, as an array of tag indices
+        :param closer_tags: The indices of the possible tags of the current word
+        :param factored: If True, uses the score tables, otherwise creates the feature vector of each history
+        :return: An array of shape (number of states, number of closer tags)
+        """
+        # Score every (state, closer tag) pair at once
+        if factored:
+            entries = self.score_tables.emission_entries(history_words, next_words)
+            scores = self.score_tables.scores(entries, states)[:, closer_tags]
+        else:
+            histories = [History(words=history_words,
+                                 tags=(*(self.tag_list[tag] for tag in prev_tags), self.tag_list[closer_tag]),
+                                 next_words=next_words)
+                         for prev_tags in states for closer_tag in closer_tags]
+            scores = self._score_histories(histories).reshape(len(states), len(closer_tags))
+
+        # log of the softmax over the closer tags
+        max_scores = scores.max(axis=1, keepdims=True)
+        return scores - max_scores - np.log(np.exp(scores - max_scores).sum(axis=1, keepdims=True))
+
+    def infer(self, words: Tuple[str, ...], beam_size: Optional[int] = 5, factored: bool = True,
+              margin: Optional[float] = None) -> List[str]:
+        """
+        Infer the tags of the given words using Viterbi (beam search) algorithm
+
+        :param words: The words in the sentence
+        :param beam_size: The width of the beam, if None then uses the exact Viterbi algorithm
+        :param factored: If True, scores the histories using the score tables,
+                         otherwise creates the feature vector of each history
+        :param margin: If given, keeps only the states whose log-probability is within the margin of the best state
+                       (at most beam_size states)
+        :return: The predicted tags as a list
+        """
+        if instrumentation.enabled:
+            instrumentation.count("sentences_decoded")
+            instrumentation.count("tokens_decoded", len(words))
+            with instrumentation.stage("infer"):
+                if beam_size is None:
+                    return self._infer_exact(words, factored)
+                return self._infer_beam(words, beam_size, factored, margin)
+
+        if beam_size is None:
+            return self._infer_exact(words, factored)
+        return self._infer_beam(words, beam_size, factored, margin)
+
+    def infer_batch(self, sentences: Iterable[Tuple[str, ...]], beam_size: Optional[int] = 5, factored: bool = True,
+                    margin: Optional[float] = None) -> List[List[str]]:
+        """
+        Infer the tags of several sentences (see infer)
+
+        :param sentences: The sentences (each one is the words of the sentence)
+        :return: The predicted tags of each sentence
+        """
+        return [self.infer(words, beam_size, factored, margin) if words else [] for words in sentences]
+
+    def _infer_beam(self, words: Tuple[str, ...], beam_size: int, factored: bool,
+                    margin: Optional[float]) -> List[str]:
+        number_of_tags = len(self.tag_list)
+        self.beam_widths = []
+
+        # The beam: each row holds the last (history_length - 1) tags of a state, with its log-probability
+        beam_tags = np.full((1, self.history_length - 1), self.tag_index[self.start_symbol])
+        beam_scores = np.zeros(1)
+        back_pointers = []  # The index of the parent state of each state in the beam
+        chosen_tags = []  # The tag of the current word of each state in the beam
+
+        for history_words, next_words, closer_tags in self._positions(words):
+            # Add the log-probability of the previous state
+            scores = self._log_probabilities(history_words, next_words, beam_tags, closer_tags, factored)
+            scores = (scores + beam_scores[:, np.newaxis]).ravel()
+
+            # The new state is identified by its last (history_length - 1) tags
+            parents = np.repeat(np.arange(len(beam_tags)), len(closer_tags))
+            new_closers = np.tile(closer_tags, len(beam_tags))
+            new_states = np.column_stack([beam_tags[parents, 1:], new_closers])
+            state_ids = np.ravel_multi_index(new_states.T, (number_of_tags,) * new_states.shape[1])
+            order = np.arange(len(scores))
+
+            # For each new state keep the best parent (the first one in case of a tie), without sorting:
+            # the best score of each state, then the first entry which reaches it
+            number_of_states = number_of_tags ** new_states.shape[1]
+            best_scores = np.full(number_of_states, -np.inf)
+            np.maximum.at(best_scores, state_ids, scores)
+            is_best = scores == best_scores[state_ids]
+            best_parents = np.full(number_of_states, len(order))
+            np.minimum.at(best_parents, state_ids[is_best], order[is_best])
+            candidates = best_parents[best_parents < len(order)]  # By the id of the state
+
+            if margin is None:
+                # Reduce the options in respect to the beam size (ties keep the order of first appearance)
+                if beam_size < len(candidates):
+                    # Keep the states which are not worse than the beam_size-th best (including its ties)
+                    cutoff = np.partition(-scores[candidates], beam_size - 1)[beam_size - 1]
+                    candidates = candidates[-scores[candidates] <= cutoff]
+                first_appearance = np.full(number_of_states, len(order))
+                np.minimum.at(first_appearance, state_ids, order)
+                candidates = candidates[np.lexsort((first_appearance[state_ids[candidates]], -scores[candidates]))]
+                candidates = candidates[:beam_size]
             else:
-                relevant_closer_tags = [self.end_symbol]
-
-            # Iterate over previous non-zero options
-            for prev_tags, prev_value in prev_probability.items():
-                vectors = []
-                keys = []
-                # Create all possible tags for the current word
-                for closer_tag in relevant_closer_tags:
-                    key = (*prev_tags[1:], closer_tag)
-                    keys.append(key)
-                    history = History(words=history_words,
-                                      tags=(*prev_tags, closer_tag),
-                                      next_words=tuple([next_word]))
-                    vector = self.feature_id.history_to_vector(history)
-                    vectors.append(vector)
-
-                # Calculate the probability of each tag
-                matrix = sp.hstack(vectors)
-                numerators = np.exp(self.weights @ matrix)
-                probabilities = numerators / np.sum(numerators) * prev_value
-
-                # Choose the option with the maximal probability
-                for key, probability in zip(keys, probabilities):
-                    if probability > cur_probability.get(key, 0):
-                        cur_probability[key] = probability
-                        back_pointers[index][key] = prev_tags[0]
-
-            # Reduce the options in respect to the beam size
-            temp_probability = sorted(cur_probability.items(), key=lambda item: item[1], reverse=True)
-            prev_probability = dict(temp_probability[:beam_size])
-            cur_probability.clear()
+                # Keep the states within the margin of the best state, and at most beam_size of them
+                candidates = candidates[scores[candidates].max() - margin <= scores[candidates]]
+                if beam_size < len(candidates):
+                    candidates = candidates[np.argpartition(-scores[candidates], beam_size - 1)[:beam_size]]
+                candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            self.beam_widths.append(len(candidates))
+            if instrumentation.enabled:
+                instrumentation.count("beam_states_expanded", len(scores))
+                instrumentation.count("beam_states_kept", len(candidates))
+
+            beam_tags = new_states[candidates]
+            beam_scores = scores[candidates]
+            back_pointers.append(parents[candidates])
+            chosen_tags.append(new_closers[candidates])
+
+        # Use the back-pointers to find the tags (the best final state is the first in the beam)
+        predicted_tags = []
+        state = 0
+        for index in range(len(back_pointers) - 1, -1, -1):
+            predicted_tags.append(self.tag_list[chosen_tags[index][state]])
+            state = back_pointers[index][state]
+
+        # Return the tags without the start and end padding
+        return predicted_tags[::-1][:-1]
+
+    def _infer_exact(self, words: Tuple[str, ...], factored: bool) -> List[str]:
+        number_of_tags = len(self.tag_list)
+        state_shape = (number_of_tags,) * (self.history_length - 1)
+
+        # The log-probability of the best path ending at each state (a dense array over the last tags)
+        best_scores = np.full(state_shape, -np.inf)
+        best_scores[(self.tag_index[self.start_symbol],) * (self.history_length - 1)] = 0
+        back_pointers = []  # The first tag of the best parent state of each state
+
+        for history_words, next_words, closer_tags in self._positions(words):
+            # Score only the reachable states
+            states = np.argwhere(np.isfinite(best_scores))
+            scores = self._log_probabilities(history_words, next_words, states, closer_tags, factored)
+            if instrumentation.enabled:
+                instrumentation.count("beam_states_expanded", scores.size)
+
+            # Maximize over the first tag of the previous state
+            candidates = np.full(state_shape + (len(closer_tags),), -np.inf)
+            candidates[tuple(states.T)] = scores + best_scores[tuple(states.T)][:, np.newaxis]
+
+            best_scores = np.full(state_shape, -np.inf)
+            best_scores[..., closer_tags] = candidates.max(axis=0)
+            pointers = np.zeros(state_shape, dtype=int)
+            pointers[..., closer_tags] = candidates.argmax(axis=0)
+            back_pointers.append(pointers)
 
         # Use the back-pointers to find the tags
-        predicted_tags = [""] * sentence_length
-        key = max(prev_probability, key=prev_probability.get)
-        predicted_tags[-self.history_length + 1:] = [*key]
-        for k in range(sentence_length - self.history_length + 1, 0, -1):
-            key = tuple(predicted_tags[k: k + self.history_length - 1])
-            predicted_tags[k - 1] = back_pointers[k - 1][key]
+        state = np.unravel_index(np.argmax(best_scores), state_shape)
+        predicted_tags = list(reversed(state))
+        for pointers in reversed(back_pointers[1:]):
+            state = (pointers[state], *state[:-1])
+            predicted_tags.append(state[0])
 
         # Return the tags without the start and end padding
-        return predicted_tags[self.history_length - 1: -1]
+        return [self.tag_list[tag] for tag in predicted_tags[::-1][self.history_length - 2: -1]]
+
+    def beam_disagreement(self, sentences: Iterable[Tuple[str, ...]], beam_sizes: Iterable[int],
+                          factored: bool = True) -> Dict[int, Tuple[float, float]]:
+        """
+        Measure how often the beam search disagrees with the exact Viterbi algorithm
+
+        :param sentences: The sentences (each one is the words of the sentence)
+        :param beam_sizes: The beam sizes to check
+        :param factored: If True, scores the histories using the score tables
+        :return: For each beam size, the rate of the sentences and the rate of the words that got a different tag
+        """
+        beam_sizes = list(beam_sizes)
+        different_sentences = dict.fromkeys(beam_sizes, 0)
+        different_words = dict.fromkeys(beam_sizes, 0)
+        sentence_counter = 0
+        word_counter = 0
+
+        for words in sentences:
+            exact_tags = self.infer(words, None, factored)
+            for beam_size in beam_sizes:
+                beam_tags = self.infer(words, beam_size, factored)
+                different = sum(exact_tag != beam_tag for exact_tag, beam_tag in zip(exact_tags, beam_tags))
+                different_words[beam_size] += different
+                different_sentences[beam_size] += different > 0
+            sentence_counter += 1
+            word_counter += len(words)
+
+        return {beam_size: (different_sentences[beam_size] / max(1, sentence_counter),
+                            different_words[beam_size] / max(1, word_counter))
+                for beam_size in beam_sizes}
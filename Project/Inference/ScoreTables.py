@@ -0,0 +1,133 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from ..FeatureExtraction import History, FeatureID, ModelBundle
+from ..FeatureExtraction.ModelBundle import BundleFeatures
+from ..Profiling import instrumentation
+
+
+class ScoreTables:
+    """
+    Factors the linear score of a history into a transition part and an emission part \n
+    The transition tables hold the weights of the tag-only features, and are computed once when the model is loaded.
+    The emission entries hold the weights of the word-conditioned features of a position,
+    and are computed once per sentence
+    """
+
+    def __init__(self, feature_id: FeatureID, weights: np.ndarray, tags: List[str], history_length: int):
+        """
+        Create a ScoreTables object
+
+        :param feature_id: The features of the model
+        :param weights: The weights of the model
+        :param tags: The tags, the position of a tag in the list is its index in the tables
+        :param history_length: The number of words in a history
+        """
+        self.feature_id = feature_id
+        self.history_length = history_length
+        self.number_of_tags = len(tags)
+        tag_index = {tag: index for index, tag in enumerate(tags)}
+
+        # Group the features by their words (the context), and by the number of tags they are conditioned on
+        if isinstance(feature_id.features_dict, BundleFeatures):
+            grouped = self._group_bundle_features(feature_id.features_dict.bundle, tags, history_length)
+        else:
+            grouped = dict()
+            for key, feature in feature_id.features_dict.items():
+                if history_length < len(key.tags) or any(tag not in tag_index for tag in key.tags):
+                    continue
+                tag_indices, features = grouped.setdefault((key.words, key.next_words, len(key.tags)), ([], []))
+                tag_indices.append([tag_index[tag] for tag in key.tags])
+                features.append(feature)
+
+        # transitions[length - 1] is a dense table over the last length tags (of shape number_of_tags ** length)
+        self.transitions = [np.zeros((self.number_of_tags,) * length) for length in range(1, history_length + 1)]
+
+        # The emission entries: for each context, the tag indices and the weights of its features
+        self.emissions = dict()  # type: Dict[Tuple, Tuple[np.ndarray, np.ndarray]]
+        for (words, next_words, length), (tag_indices, features) in grouped.items():
+            tag_indices = np.array(tag_indices, dtype=int).reshape(-1, length)
+            if not words and not next_words:
+                np.add.at(self.transitions[length - 1], tuple(tag_indices.T), weights[features])
+            else:
+                self.emissions[(words, next_words, length)] = (tag_indices, weights[features])
+
+    @staticmethod
+    def _group_bundle_features(bundle: ModelBundle, tags: List[str], history_length: int) \
+            -> Dict[Tuple, Tuple[np.ndarray, np.ndarray]]:
+        """
+        Group the features of a model bundle by their context (as in __init__), from the key table of the bundle
+        (only the strings of the contexts are decoded)
+
+        :return: For each context, the tag indices and the features
+        """
+        words, key_tags, next_words = bundle.key_parts()
+
+        # The tag index of each string-ID (the last entry maps the padding, -1, to -1)
+        tag_ids = bundle.string_ids(tags)
+        string_tags = np.full(len(bundle.strings) + 1, -1)
+        string_tags[tag_ids[0 <= tag_ids]] = np.flatnonzero(0 <= tag_ids)
+        tag_indices = string_tags[key_tags]
+        lengths = (0 <= key_tags).sum(axis=1)
+        features = np.flatnonzero((0 < lengths) & (lengths <= history_length) &
+                                  ((0 <= tag_indices) | (key_tags < 0)).all(axis=1))
+
+        # The features of each context, in the order of the feature IDs
+        contexts, inverse = np.unique(np.column_stack([words[features], next_words[features], lengths[features]]),
+                                      axis=0, return_inverse=True)
+        order = np.argsort(inverse.reshape(-1), kind="stable")
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(inverse.reshape(-1), minlength=len(contexts)))])
+
+        grouped = dict()
+        words_end, next_words_end = words.shape[1], words.shape[1] + next_words.shape[1]
+        for context, start, end in zip(contexts.tolist(), bounds[:-1].tolist(), bounds[1:].tolist()):
+            length = context[-1]
+            context_features = features[order[start:end]]
+            grouped[(bundle.decode(context[:words_end]), bundle.decode(context[words_end:next_words_end]), length)] = \
+                (tag_indices[context_features, :length], context_features)
+        return grouped
+
+    def emission_entries(self, history_words: Tuple[str, ...], next_words: Tuple[str, ...]) \
+            -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Collect the weights of the word-conditioned features that may be active at a position
+
+        :param history_words: The words of the history at the position
+        :param next_words: The next words after the history
+        :return: For each number of tags (starting at 1), the tag indices and the weights of the features
+        """
+        # Find the contexts of the position (they do not depend on the tags)
+        history = History(history_words, (None,) * len(history_words), next_words)
+        contexts = {(key.words, key.next_words, len(key.tags))
+                    for key in self.feature_id.feature_statistics.get_keys(history)}
+        if instrumentation.enabled:
+            instrumentation.count("feature_lookups", len(contexts))
+            instrumentation.count("feature_misses", sum(context not in self.emissions for context in contexts))
+
+        entries = []
+        for length in range(1, self.history_length + 1):
+            found = [self.emissions[context] for context in contexts
+                     if context[2] == length and context in self.emissions]
+            if found:
+                tag_indices, weights = zip(*found)
+                entries.append((np.concatenate(tag_indices), np.concatenate(weights)))
+            else:
+                entries.append((np.empty((0, length), dtype=int), np.empty(0)))
+        return entries
+
+    def scores(self, entries: List[Tuple[np.ndarray, np.ndarray]], states: np.ndarray) -> np.ndarray:
+        """
+        Calculate the linear score of each state followed by each tag
+
+        :param entries: The emission entries of the position (see emission_entries)
+        :param states: The previous (history_length - 1) tags of each state, as an array of tag indices
+        :return: An array of shape (number of states, number of tags)
+        """
+        scores = np.zeros((len(states), self.number_of_tags))
+        for length, (transition, (tag_indices, weights)) in enumerate(zip(self.transitions, entries), start=1):
+            prefixes = tuple(states[:, states.shape[1] - length + 1:].T)
+
+            # Scatter the emission weights into a dense table over the last length tags
+            emission = np.bincount(np.ravel_multi_index(tuple(tag_indices.T), transition.shape), weights,
+                                   minlength=transition.size).reshape(transition.shape)
+            scores += transition[prefixes] + emission[prefixes]
+        return scores
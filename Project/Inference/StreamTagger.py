@@ -0,0 +1,138 @@
+import os
+import numpy as np
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool, shared_memory
+from typing import Iterator, List, Optional, Tuple
+from ..FeatureExtraction import FeatureID, HistoryHandler, TagDictionary
+from ..Inference.Inference import Inference
+
+# The state of a worker process (initialized once per process)
+_worker_inference = None  # type: Optional[Inference]
+_worker_error = None  # type: Optional[Exception]
+
+
+def _initialize_worker(features_path: str, corpus_path: str, window_size: int, use_tag_dictionary: bool,
+                       weights_name: str, weights_shape: Tuple[int, ...], weights_dtype: str) -> None:
+    global _worker_inference, _worker_error
+
+    # A failing initializer makes the pool restart the worker forever,
+    # so the error is kept and raised by the tasks instead (see _tag_chunk)
+    try:
+        # The weights are copied from the shared memory block (instead of being pickled to each worker)
+        memory = shared_memory.SharedMemory(name=weights_name)
+        try:
+            weights = np.ndarray(weights_shape, dtype=weights_dtype, buffer=memory.buf).copy()
+        finally:
+            memory.close()
+
+        feature_id = FeatureID.read_features(features_path)
+        history_handler = HistoryHandler(corpus_path, window_size)
+        tag_dictionary = TagDictionary(history_handler.text_editor) if use_tag_dictionary else None
+        _worker_inference = Inference(feature_id, weights, history_handler, tag_dictionary)
+    except Exception as exception:
+        _worker_error = exception
+
+
+def _tag_chunk(chunk: List[Tuple[str, ...]], beam_size: Optional[int], margin: Optional[float]) -> List[str]:
+    if _worker_error is not None:
+        raise _worker_error
+    lines = []
+    for words in chunk:
+        if words:
+            tags = _worker_inference.infer(words, beam_size, margin=margin)
+            lines.append(" ".join(f"{word}_{tag}" for word, tag in zip(words, tags)))
+        else:
+            lines.append("")
+    return lines
+
+
+class StreamTagger:
+    """
+    Tags (unlabeled) files of sentences using a pool of processes \n
+    The sentences are read lazily and sent to the workers in chunks, the tagged sentences are written in input order
+    """
+
+    def __init__(self, features_path: str, corpus_path: str, weights: np.ndarray, window_size: int = 3,
+                 use_tag_dictionary: bool = True, processes: int = None, chunk_size: int = 64,
+                 max_pending: int = None):
+        """
+        Create a StreamTagger object
+
+        :param features_path: The path to the features json file (or a model bundle)
+        :param corpus_path: The path to the text the model was trained on
+        :param weights: The weights of the model
+        :param window_size: The window size of the histories
+        :param use_tag_dictionary: If True, scores only the candidate tags of each word
+        :param processes: The number of worker processes (if None, uses all of the cores)
+        :param chunk_size: The number of sentences in each task
+        :param max_pending: The maximal number of chunks which are in progress (bounds the memory),
+                            if None then uses twice the number of processes
+        """
+        self.features_path = features_path
+        self.corpus_path = corpus_path
+        self.weights = weights
+        self.window_size = window_size
+        self.use_tag_dictionary = use_tag_dictionary
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+
+    @staticmethod
+    def read_sentences(path: str) -> Iterator[Tuple[str, ...]]:
+        """
+        Read the sentences of a file of space separated words, one sentence at a time
+
+        :param path: The path to the file
+        :return: yields the words of each sentence
+        """
+        with open(path) as file:
+            for line in file:
+                line = line.rstrip("\r\n")
+                yield tuple(line.split(" ")) if line else tuple()
+
+    def tag_file(self, input_path: str, output_path: str, beam_size: Optional[int] = 5,
+                 margin: Optional[float] = None) -> int:
+        """
+        Tag all of the sentences in the input file and write them as word_tag pairs to the output file
+
+        :param input_path: The path to a file of space separated words, a sentence per line
+        :param output_path: The path to write the tagged sentences to
+        :param beam_size: The width of the beam (see Inference.infer)
+        :param margin: The margin of the adaptive beam (see Inference.infer)
+        :return: The number of tagged sentences
+        """
+        weights = np.ascontiguousarray(self.weights)
+        memory = shared_memory.SharedMemory(create=True, size=max(1, weights.nbytes))
+        try:
+            np.ndarray(weights.shape, dtype=weights.dtype, buffer=memory.buf)[...] = weights
+
+            initargs = (self.features_path, self.corpus_path, self.window_size, self.use_tag_dictionary,
+                        memory.name, weights.shape, weights.dtype.str)
+            processes = self.processes or os.cpu_count() or 1
+            max_pending = self.max_pending or 2 * processes
+            with Pool(processes, initializer=_initialize_worker, initargs=initargs) as pool:
+                sentences = self.read_sentences(input_path)
+                pending = deque()
+                counter = 0
+
+                with open(output_path, "w") as output:
+                    while True:
+                        # Keep at most max_pending chunks in progress
+                        while len(pending) < max_pending:
+                            chunk = list(islice(sentences, self.chunk_size))
+                            if not chunk:
+                                break
+                            pending.append(pool.apply_async(_tag_chunk, (chunk, beam_size, margin)))
+                        if not pending:
+                            break
+
+                        # Write the oldest chunk (keeps the input order)
+                        lines = pending.popleft().get()
+                        output.writelines(f"{line}\n" for line in lines)
+                        counter += len(lines)
+        finally:
+            memory.close()
+            memory.unlink()
+
+        return counter
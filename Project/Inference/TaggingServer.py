@@ -0,0 +1,212 @@
+import asyncio
+import json
+import time
+import numpy as np
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from ..Inference.Inference import Inference
+
+
+class TaggingServer:
+    """
+    A long-running local tagging server over TCP or a Unix socket \n
+    The protocol is line based: each request is a line of space separated words,
+    and the response is a line of word_tag pairs. The request "STATS" returns the counters as a json line. \n
+    Concurrent requests are collected into micro-batches, which are decoded together
+    """
+
+    stats_request = "STATS"
+
+    def __init__(self, inference: Inference, beam_size: Optional[int] = 5, margin: Optional[float] = None,
+                 max_batch_size: int = 32, max_delay: float = 0.005, latency_window: int = 10000):
+        """
+        Create a TaggingServer object
+
+        :param inference: The (loaded) model to tag with
+        :param beam_size: The width of the beam (see Inference.infer)
+        :param margin: The margin of the adaptive beam (see Inference.infer)
+        :param max_batch_size: The maximal number of sentences in a batch
+        :param max_delay: The maximal time (in seconds) to wait for more requests after the first one in a batch
+        :param latency_window: The number of recent requests to calculate the latency percentiles over
+        """
+        self.inference = inference
+        self.beam_size = beam_size
+        self.margin = margin
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.queue = None  # type: Optional[asyncio.Queue]
+        self.batcher = None  # type: Optional[asyncio.Task]
+        self.latencies = deque(maxlen=latency_window)
+        self.request_counter = 0
+        self.word_counter = 0
+        self.batch_counter = 0
+        self.start_time = time.perf_counter()
+
+    # <editor-fold desc="Server">
+    async def start(self, host: str = "127.0.0.1", port: int = 8765, path: str = None) -> asyncio.AbstractServer:
+        """
+        Start listening and decoding
+
+        :param host: The host to listen on (TCP)
+        :param port: The port to listen on (TCP)
+        :param path: If given, listens on this Unix socket instead of TCP
+        :return: The asyncio server
+        """
+        self.queue = asyncio.Queue()
+        self.start_time = time.perf_counter()
+        # The task is kept, the event loop holds only a weak reference to it
+        self.batcher = asyncio.ensure_future(self._batcher())
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle, path=path)
+        return await asyncio.start_server(self._handle, host=host, port=port)
+
+    async def stop(self) -> None:
+        """
+        Stop decoding (the requests which are still queued are not answered)
+        """
+        if self.batcher is not None:
+            self.batcher.cancel()
+            try:
+                await self.batcher
+            except asyncio.CancelledError:
+                pass
+            self.batcher = None
+
+    def serve_forever(self, host: str = "127.0.0.1", port: int = 8765, path: str = None) -> None:
+        async def serve():
+            server = await self.start(host, port, path)
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                await self.stop()
+
+        asyncio.run(serve())
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.decode().rstrip("\r\n")
+                if line == TaggingServer.stats_request:
+                    response = json.dumps(self.statistics())
+                else:
+                    future = loop.create_future()
+                    await self.queue.put((tuple(line.split(" ")) if line else tuple(), future, time.perf_counter()))
+                    response = await future
+                writer.write(f"{response}\n".encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            # Wait for the first request, then collect more requests until the batch is full or the delay passed
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            sentences = [words for words, _, _ in batch]
+            responses = await loop.run_in_executor(None, self._decode, sentences)
+
+            end = time.perf_counter()
+            for (words, future, start), response in zip(batch, responses):
+                self.latencies.append(end - start)
+                self.word_counter += len(words)
+                if not future.done():
+                    future.set_result(response)
+            self.request_counter += len(batch)
+            self.batch_counter += 1
+
+    def _decode(self, sentences: List[Tuple[str, ...]]) -> List[str]:
+        # Each sentence is decoded separately, so a failing sentence fails only its own request
+        responses = []
+        for words in sentences:
+            try:
+                tags = self.inference.infer_batch([words], self.beam_size, margin=self.margin)[0]
+            except Exception as exception:
+                responses.append(f"ERROR {exception}")
+            else:
+                responses.append(" ".join(f"{word}_{tag}" for word, tag in zip(words, tags)))
+        return responses
+
+    # </editor-fold>
+
+    def statistics(self) -> Dict[str, float]:
+        """
+        :return: The counters of the server (latencies are in milliseconds)
+        """
+        elapsed = time.perf_counter() - self.start_time
+        latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            "requests": self.request_counter,
+            "batches": self.batch_counter,
+            "mean_batch_size": self.request_counter / max(1, self.batch_counter),
+            "sentences_per_sec": self.request_counter / elapsed,
+            "words_per_sec": self.word_counter / elapsed,
+            "latency_p50_ms": float(np.percentile(latencies, 50)),
+            "latency_p99_ms": float(np.percentile(latencies, 99)),
+        }
+
+
+async def load_test(sentences: Sequence[Tuple[str, ...]], concurrency: int = 8, host: str = "127.0.0.1",
+                    port: int = 8765, path: str = None) -> Dict[str, Any]:
+    """
+    Send the sentences to a running server from several concurrent connections
+
+    :param sentences: The sentences to tag (each one is the words of the sentence)
+    :param concurrency: The number of concurrent connections
+    :param host: The host of the server (TCP)
+    :param port: The port of the server (TCP)
+    :param path: If given, connects to this Unix socket instead of TCP
+    :return: The throughput and the latencies (in milliseconds) measured by the client, and the server counters
+    """
+    latencies = []
+
+    async def connection(part: Sequence[Tuple[str, ...]]):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        for words in part:
+            start = time.perf_counter()
+            writer.write(f"{' '.join(words)}\n".encode())
+            await writer.drain()
+            await reader.readline()
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+        await writer.wait_closed()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(connection(sentences[i::concurrency]) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    # Get the counters of the server
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"{TaggingServer.stats_request}\n".encode())
+    server_statistics = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+
+    latencies = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "sentences_per_sec": len(sentences) / elapsed,
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p99_ms": float(np.percentile(latencies, 99)),
+        "server": server_statistics,
+    }
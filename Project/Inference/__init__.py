@@ -1 +1,6 @@
+from ..Inference.ScoreTables import ScoreTables
+from ..Inference.HashedScoreTables import HashedScoreTables
 from ..Inference.Inference import Inference
+from ..Inference.StreamTagger import StreamTagger
+from ..Inference.TaggingServer import TaggingServer, load_test
+from ..Inference.Evaluation import Evaluation
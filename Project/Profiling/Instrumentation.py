@@ -0,0 +1,150 @@
+import functools
+import json
+import logging
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+
+class Instrumentation:
+    """
+    Opt-in counters, per-stage timers and per-stage peak memory (tracemalloc) of the hot paths \n
+    The instrumented code checks the enabled flag before doing any work, so when disabled the cost is a single
+    attribute lookup per call. The module-level instance (instrumentation) is the one used by the package
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.counters = Counter()  # type: Counter
+        self.timers = dict()  # type: Dict[str, List[float]]  # stage -> [calls, total seconds, max seconds]
+        self.memory = dict()  # type: Dict[str, int]  # stage -> peak traced bytes (above the start of the stage)
+        self._memory_stack = []  # type: List[List[int]]  # [traced bytes at the start, peak seen by inner stages]
+
+    def enable(self, trace_memory: bool = False) -> None:
+        """
+        Start collecting
+
+        :param trace_memory: If True, also traces the peak memory of each stage (slows the code down)
+        """
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self) -> None:
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    def reset(self) -> None:
+        self.counters.clear()
+        self.timers.clear()
+        self.memory.clear()
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            self.counters[name] += value
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the enclosed code (and trace its peak memory) as the given stage, stages may be nested
+        """
+        if not self.enabled:
+            yield
+            return
+
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._memory_stack:
+                # Keep the peak of the outer stage, since it is reset for this stage
+                self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+            self._memory_stack.append([current, 0])
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += duration
+            timer[2] = max(timer[2], duration)
+
+            if self.trace_memory:
+                start_memory, inner_peak = self._memory_stack.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], inner_peak)
+                self.memory[name] = max(self.memory.get(name, 0), peak - start_memory)
+                if self._memory_stack:
+                    self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+
+    def timed(self, name: str, counter: str = None) -> Callable[[Callable], Callable]:
+        """
+        A decorator which times every call of the function as the given stage (see stage)
+
+        :param name: The name of the stage
+        :param counter: If given, the name of a counter of the calls
+        """
+        def decorator(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                if counter is not None:
+                    self.counters[counter] += 1
+                with self.stage(name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    # <editor-fold desc="Export">
+    def report(self) -> Dict[str, Any]:
+        """
+        :return: The counters, the timers (in seconds) and the peak memory (in bytes) of each stage, with the derived
+                 ratios (lookup miss rate, observation cache hit rate, expanded beam states per token)
+        """
+        counters = self.counters
+        derived = dict()
+        if counters["feature_lookups"]:
+            derived["feature_miss_rate"] = counters["feature_misses"] / counters["feature_lookups"]
+        observation_lookups = counters["observation_cache_hits"] + counters["observation_cache_misses"]
+        if observation_lookups:
+            derived["observation_cache_hit_rate"] = counters["observation_cache_hits"] / observation_lookups
+        if counters["tokens_decoded"]:
+            derived["beam_states_per_token"] = counters["beam_states_expanded"] / counters["tokens_decoded"]
+        return {
+            "counters": dict(counters),
+            "derived": derived,
+            "stages": {name: {"calls": calls, "total_sec": total, "mean_sec": total / calls, "max_sec": maximum}
+                       for name, (calls, total, maximum) in self.timers.items()},
+            "peak_memory_bytes": dict(self.memory),
+        }
+
+    def save_json(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+    def log(self, logger: logging.Logger = None, level: int = logging.INFO) -> None:
+        """
+        Write the report to a logger, a line per counter and per stage
+        """
+        logger = logger or logging.getLogger(__name__)
+        report = self.report()
+        for name, value in {**report["counters"], **report["derived"]}.items():
+            logger.log(level, "%s: %s", name, value)
+        for name, timer in report["stages"].items():
+            logger.log(level, "stage %s: %d calls, %.6f sec total, %.6f sec mean, peak memory %s bytes",
+                       name, timer["calls"], timer["total_sec"], timer["mean_sec"], self.memory.get(name, "-"))
+
+    # </editor-fold>
+
+
+# The instrumentation of the package (disabled by default)
+instrumentation = Instrumentation()
@@ -0,0 +1 @@
+from ..Profiling.Instrumentation import Instrumentation, instrumentation
@@ -0,0 +1,99 @@
+import queue
+import time
+from multiprocessing import Process, Queue
+from typing import List, Tuple
+import numpy as np
+import scipy.sparse as sp
+
+
+def _produce_batches(optimizer, batch_sizes: List[int], use_cache: bool, batches: Queue) -> None:
+    try:
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            observations, tags = optimizer._prepare_batch(batch_size, use_cache)
+            batches.put((observations, tags, time.perf_counter() - start))  # Blocks while the queue is full
+    except Exception as exception:
+        # The consumer raises it (see BatchPrefetcher.next)
+        batches.put(exception)
+
+
+class BatchPrefetcher:
+    """
+    Prepares the batches of the optimization in a background process (producer),
+    while the optimizer runs on the current batch (consumer) \\n
+    The batches are passed through a bounded queue, so at most prefetch batches are kept in memory.
+    An exception of the producer is raised by next, and so is an error if the producer stopped without a batch
+    """
+
+    poll_interval = 1.0  # The time (in seconds) to wait for a batch before checking that the producer is alive
+
+    def __init__(self, optimizer, batch_sizes: List[int], use_cache: bool, prefetch: int = 2):
+        """
+        Create a BatchPrefetcher object (starts the background process)
+
+        :param optimizer: The Optimizer to prepare the batches with (see Optimizer._prepare_batch)
+        :param batch_sizes: The number of lines in each batch
+        :param use_cache: If True, slices the batches from the cached matrices
+        :param prefetch: The maximal number of prepared batches waiting in the queue,
+                         if 0 then prepares each batch only when it is requested (in this process)
+        """
+        self.optimizer = optimizer
+        self.batch_sizes = list(batch_sizes)
+        self.use_cache = use_cache
+        self.prefetch = prefetch
+        self.index = 0
+
+        self.preparation_time = 0  # The total time it took to prepare the batches
+        self.waiting_time = 0  # The total time the consumer waited for the batches
+
+        self.queue = None
+        self.producer = None
+        if 0 < prefetch:
+            self.queue = Queue(maxsize=prefetch)
+            self.producer = Process(target=_produce_batches, daemon=True,
+                                    args=(optimizer, self.batch_sizes, use_cache, self.queue))
+            self.producer.start()
+
+    def next(self) -> Tuple[sp.csr_matrix, np.ndarray, float, float]:
+        """
+        Get the next batch
+
+        :return: The observations and the tags of the batch, the time it took to prepare it,
+                 and the time waited for it
+        """
+        start = time.perf_counter()
+        if self.producer is None:
+            observations, tags = self.optimizer._prepare_batch(self.batch_sizes[self.index], self.use_cache)
+            preparation_time = time.perf_counter() - start
+        else:
+            batch = self._get()
+            if isinstance(batch, Exception):
+                raise batch
+            observations, tags, preparation_time = batch
+        waiting_time = time.perf_counter() - start
+        self.index += 1
+
+        self.preparation_time += preparation_time
+        self.waiting_time += waiting_time
+        return observations, tags, preparation_time, waiting_time
+
+    def _get(self):
+        while True:
+            # Checked before waiting, so a batch put just before the producer stopped is not missed
+            alive = self.producer.is_alive()
+            try:
+                return self.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if not alive:
+                    raise RuntimeError(f"The batch producer stopped (exit code {self.producer.exitcode})")
+
+    def close(self) -> None:
+        """
+        Stop the background process
+        """
+        if self.producer is not None:
+            if self.producer.is_alive():
+                self.producer.terminate()
+            self.producer.join()
+            self.queue.close()
+            self.producer = None
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+from ..FeatureExtraction import FeatureID, HistoryHandler, ModelBundle
+from ..Inference.Evaluation import Evaluation
+from ..Inference.Inference import Inference
+
+
+class ModelCompressor:
+    """
+    Makes a trained model smaller: drops the features whose absolute weight is below a threshold,
+    gives the kept features compact IDs (in their original order) and stores the weights with a smaller type
+    """
+
+    def __init__(self, feature_id: FeatureID, weights: np.ndarray):
+        """
+        Create a ModelCompressor object
+
+        :param feature_id: The features of the trained model
+        :param weights: The weights of the trained model
+        """
+        self.feature_id = feature_id
+        self.weights = np.asarray(weights)
+
+    def compress(self, threshold: float = 1e-3, dtype: type = np.float32) -> Tuple[FeatureID, np.ndarray]:
+        """
+        Create the compressed model
+
+        :param threshold: The features whose absolute weight is below the threshold are dropped
+        :param dtype: The type of the compressed weights
+        :return: The features and the weights of the compressed model
+        """
+        kept = np.abs(self.weights) >= threshold
+
+        # The new ID of each kept feature is the number of kept features before it
+        new_ids = np.cumsum(kept) - 1
+        feature_id = FeatureID()
+        feature_id.features_dict = OrderedDict((key, int(new_ids[feature]))
+                                               for key, feature in self.feature_id.features_dict.items()
+                                               if kept[feature])
+        feature_id.id_counter = len(feature_id.features_dict)
+        return feature_id, self.weights[kept].astype(dtype)
+
+    # <editor-fold desc="Report">
+    @staticmethod
+    def model_size(feature_id: FeatureID, weights: np.ndarray) -> int:
+        """
+        :return: The size (in bytes) of the model as a bundle (see ModelBundle)
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "model.bundle")
+            ModelBundle.write(path, feature_id.features_dict, weights)
+            return os.path.getsize(path)
+
+    def report(self, compressed: Tuple[FeatureID, np.ndarray], corpus_path: str, test_path: str,
+               window_size: int = 3, beam_size: int = 5, max_sentences: int = None) -> Dict[str, Any]:
+        """
+        Compare the compressed model with the original one
+
+        :param compressed: The features and the weights of the compressed model (see compress)
+        :param corpus_path: The corpus the model was trained on
+        :param test_path: A file of word_tag pairs to evaluate both models on
+        :param window_size: The window size of the histories
+        :param beam_size: The width of the beam
+        :param max_sentences: The maximal number of sentences to evaluate
+        :return: The number of features, the size, the decode speed and the accuracy of both models
+        """
+        history_handler = HistoryHandler(corpus_path, window_size)
+        models = {"original": (self.feature_id, self.weights), "compressed": compressed}
+
+        report = dict()
+        for name, (feature_id, weights) in models.items():
+            evaluation = Evaluation(Inference(feature_id, weights, history_handler), beam_size)
+            result = evaluation.evaluate(test_path, max_sentences)
+            report[name] = {"features": feature_id.number_of_features,
+                            "weights_dtype": str(weights.dtype),
+                            "size_bytes": self.model_size(feature_id, weights),
+                            "accuracy": result["accuracy"],
+                            "tokens_per_sec": result["tokens_per_sec"]}
+
+        original, compressed = report["original"], report["compressed"]
+        report["change"] = {"size_ratio": compressed["size_bytes"] / original["size_bytes"],
+                            "speedup": compressed["tokens_per_sec"] / original["tokens_per_sec"],
+                            "accuracy_change": compressed["accuracy"] - original["accuracy"]}
+        return report
+
+    # </editor-fold>
@@ -1,8 +1,15 @@
 from ..FeatureExtraction.HistoryHandler import HistoryHandler
 from ..FeatureExtraction.FeatureID import FeatureID
 from ..FeatureExtraction.History import History
+from ..FeatureExtraction.FactoredFeatures import FactoredFeatures
+from ..FeatureExtraction.ModelBundle import ModelBundle
+from ..Train.TrainingCache import TrainingCache
+from ..Train.ShardedObjective import ShardedObjective
+from ..Train.BatchPrefetcher import BatchPrefetcher
+from ..Profiling import instrumentation
+import os
 import numpy as np
-from typing import Iterable, List, Tuple
+from typing import Iterable, Tuple
 from scipy.optimize import fmin_l_bfgs_b as minimize
 import scipy.sparse as sp
 
@@ -12,7 +19,8 @@ class Optimizer:
     Optimize the weights vector in order to maximize the likelihood of the data-set
     """
 
-    def __init__(self, feature_id: FeatureID, history_handler: HistoryHandler, path: str):
+    def __init__(self, feature_id: FeatureID, history_handler: HistoryHandler, path: str,
+                 cache_directory: str = "cache"):
         self.feature_id = feature_id
         self.history_handler = history_handler
         self.weights = np.empty(feature_id.number_of_features)
@@ -20,68 +28,114 @@ class Optimizer:
         self.path = path
         self.initialize_weight()
 
-    def _preprocess_histories(self, histories: Iterable[History]) -> Tuple[sp.coo_matrix, List[sp.coo_matrix]]:
+        # Compute the observations of the corpus words once (there is no observation index in the feature-hashing mode)
+        if not feature_id.hashed_features:
+            self.feature_id.observation_index.precompute(history_handler.words)
+
+        # The tags are sorted so the cached tag indices are the same in every run
+        self.factored_features = FactoredFeatures(feature_id, sorted(history_handler.tags))
+        self.training_cache = TrainingCache(cache_directory)
+        self._training_data = None
+
+    @instrumentation.timed("preprocess_histories")
+    def _preprocess_histories(self, histories: Iterable[History]) -> Tuple[sp.csr_matrix, sp.csr_matrix, np.ndarray]:
         """
-        Create the vectors of the given histories and the matrices of the histories with changed last tag
+        Create the vectors of the given histories and the matrix of the histories with changed last tag
 
         :param histories: The histories to create the feature vectors from
-        :return: The vectors of the histories as a coo_matrix (each column is a vector feature)<br>
-                The altered vectors for each history:<br>
-                (each element in the list is corresponding to a different history, each column is a vector feature)
+        :return: The vectors of the histories as a csr_matrix (each row is a vector feature)<br>
+                The altered vectors of all of the histories stacked as a single csr_matrix (each row is a vector feature)
+                <br>
+                The offsets of the altered vectors of each history in the stacked matrix
+                (the altered vectors of history i are the rows offsets[i] to offsets[i + 1])
         """
-        vectors = []
-        alter_matrices = []
-        tags = list(self.history_handler.text_editor.tags)
+        tags = list(self.history_handler.tags)
 
         histories = list(histories)
-        for history in histories:
-            vectors.append(self.feature_id.history_to_vector(history))
+        vectors = self.feature_id.histories_to_csr(histories)
+
+        # change the last tag and create the altered feature vectors, all of the histories at once
+        alternated_histories = [History(history.words, (*(history.tags[:-1]), tag), history.next_words)
+                                for history in histories for tag in tags]
+        alter_matrix = self.feature_id.histories_to_csr(alternated_histories)
+        offsets = np.arange(0, len(alternated_histories) + 1, len(tags))
+
+        return vectors, alter_matrix, offsets
+
+    @instrumentation.timed("preprocess_factored")
+    def _preprocess_factored(self, histories: Iterable[History]) -> Tuple[sp.csr_matrix, np.ndarray]:
+        """
+        Create the tag-factored representation of the given histories (see FactoredFeatures)
+
+        :param histories: The histories to create the representation from
+        :return: The observations of the histories as a csr_matrix (a row per history)<br>
+                The index of the tag of each history
+        """
+        return self.factored_features.histories_to_observations(histories)
 
-            new_vectors = []
-            for tag in tags:
-                # change the last tag and create the altered feature vector
-                alternated_history = History(history.words, (*(history.tags[:-1]), tag), history.next_words)
-                new_vectors.append(self.feature_id.history_to_vector(alternated_history))
-            alter_matrices.append(sp.hstack(new_vectors))
+    @instrumentation.timed("load_training_data")
+    def load_training_data(self) -> Tuple[sp.csr_matrix, np.ndarray, np.ndarray]:
+        """
+        Get the tag-factored representation of all of the histories in the corpus,
+        from the cache if it exists (otherwise creates it and saves it to the cache)
 
-        vectors = sp.hstack(vectors)
-        return vectors, alter_matrices
+        :return: The observations of the histories as a csr_matrix (a row per history)<br>
+                The index of the tag of each history<br>
+                The index of the first history of each line (and the number of histories at the end)
+        """
+        if self._training_data is not None:
+            return self._training_data
+
+        key = TrainingCache.key(self.history_handler.file_path, self.feature_id, self.history_handler.history_length,
+                                self.factored_features.tags)
+        training_data = self.training_cache.load(key)
+        if training_data is None:
+            # Streamed from the corpus store (if used), so the histories of the whole corpus are never in memory
+            observations, tags = self._preprocess_factored(self.history_handler.iter_histories())
+            line_offsets = self.history_handler.line_offsets()
+
+            self.training_cache.save(key, observations, tags, line_offsets)
+            training_data = self.training_cache.load(key)
+        self._training_data = training_data
+        return training_data
 
     @staticmethod
-    def objective(weights: np.ndarray, vectors: sp.coo_matrix, alter_matrices: List[sp.coo_matrix],
+    @instrumentation.timed("objective", "objective_evaluations")
+    def objective(weights: np.ndarray, vectors: sp.csr_matrix, alter_matrix: sp.csr_matrix, offsets: np.ndarray,
                   regularization: float) -> Tuple[float, np.ndarray]:
         """
         Calculate the objective and the gradient at the given weights vector
 
         :param weights: The weights vector
-        :param vectors: The feature vectors of the histories
-        :param alter_matrices: The matrices of the histories with altered last tag
+        :param vectors: The feature vectors of the histories (a row per history)
+        :param alter_matrix: The stacked feature vectors of the histories with altered last tag
+        :param offsets: The offsets of the altered vectors of each history in alter_matrix
         :param regularization: The regularization coefficient
         :return: The negative likelihood and the negative gradient
         """
-
-        n = len(alter_matrices)
-
-        vf = lambda vec: weights @ vec
+        starts = offsets[:-1]
+        lengths = np.diff(offsets)
 
         # \sum_{i=1}^{n} { f(x_{i}, y_{i} }
-        empirical_counts = np.sum(vectors.A, axis=1)
+        empirical_counts = np.asarray(vectors.sum(axis=0)).ravel()
 
         # v^T \sum_{i=1}^{n} { f(x_{i}, y_{i} }
-        linear_term = float(vf(empirical_counts))
+        linear_term = float(weights @ empirical_counts)
 
-        # at position i, j: e^{v^T f(x_{i}, y'_{j}}
-        numerators = [np.exp(vf(alter_matrices[i])) for i in range(n)]
+        # at position (i, j): v^T f(x_{i}, y'_{j})
+        scores = alter_matrix @ weights
 
-        # at position i: \sum_{y' \in Y} { e^{v^T f(x_{i}, y' }
-        denominators = np.array([np.sum(numerators[i]) for i in range(n)])
+        # at position i: log {\sum_{y' \in Y} { e^{v^T f(x_{i}, y' } } (segment-wise log-sum-exp)
+        max_scores = np.maximum.reduceat(scores, starts)
+        shifted = np.exp(scores - np.repeat(max_scores, lengths))
+        log_denominators = max_scores + np.log(np.add.reduceat(shifted, starts))
 
         # \sum_{i=1}^{n} { log {\sum_{y' \in Y} { e^{v^T f(x_{i}, y' } } }
-        normalization_term = np.sum(np.log(denominators))
+        normalization_term = np.sum(log_denominators)
 
         # \sum_{i=1}^{n}{\frac{\sum_{y'\in Y}{f(x_{i},y')e^{v^T f(x_{i},y'}} }{\sum_{y'\in Y}{e^{v^T f(x_{i},y')}}}
-        expected_counts = np.add.reduce([alter_matrices[i] @ numerators[i].T / denominators[i] for i in range(n)])
-        # TODO: check the above line - is it the correct calculation
+        probabilities = np.exp(scores - np.repeat(log_denominators, lengths))
+        expected_counts = alter_matrix.T @ probabilities
 
         # \frac{1}{2} \lambda {\norm v \norm}^2
         regularization_term = 1 / 2 * regularization * np.linalg.norm(weights) ** 2
@@ -93,50 +147,273 @@ class Optimizer:
         gradient = empirical_counts - expected_counts - regularization_gradient
         return -likelihood, -gradient
 
-    def optimize(self):
+    @staticmethod
+    @instrumentation.timed("objective", "objective_evaluations")
+    def factored_objective(weights: np.ndarray, observations: sp.csr_matrix, tags: np.ndarray,
+                           table: Tuple[np.ndarray, np.ndarray, np.ndarray], number_of_tags: int,
+                           regularization: float) -> Tuple[float, np.ndarray]:
         """
-        Optimize the weights vector using (Stochastic) Gradient Descent
+        Calculate the objective and the gradient at the given weights vector,
+        using the tag-factored representation of the histories
 
-        :return: The calculated weights vector
+        :param weights: The weights vector
+        :param observations: The observations of the histories (a row per history)
+        :param tags: The index of the tag of each history
+        :param table: The feature of each (observation, tag) pair, as the arrays (observations, tags, features)
+        :param number_of_tags: The number of tags
+        :param regularization: The regularization coefficient
+        :return: The negative likelihood and the negative gradient
         """
-        batch_size = 200  # The number of lines in each batch (about 25 histories per line)
-        epsilon = 0  # .001  # The gradient threshold (if the norm of the gradient is less than epsilon, stops)
-        # Get random histories for this batch
-        for iteration in range(30):
-            w_0 = self.weights  # The current weights vector
+        rows, columns, features = table
+        histories = np.arange(len(tags))
 
-            histories = self.history_handler.create_histories(batch_size, "RANDOM")
+        # at position (o, y): the weight of the feature of observation o with tag y
+        observation_weights = np.zeros((observations.shape[1], number_of_tags))
+        observation_weights[rows, columns] = weights[features]
 
-            # Calculates the feature vectors required
-            vectors, alter_matrices = self._preprocess_histories(histories)
-            print(f"Iteration {iteration}\n"
-                  f"\tNumber of histories: {len(histories)}")
-            args = (vectors, alter_matrices, 0.5)  # The argument for the objective function
+        # at position (i, y): v^T f(x_{i}, y)
+        scores = observations @ observation_weights
 
-            # Gradient Descent for the current batch
-            optimal_params = minimize(func=Optimizer.objective, x0=w_0, args=args,
-                                      maxiter=10 * int(np.sqrt(batch_size)))
+        # v^T \sum_{i=1}^{n} { f(x_{i}, y_{i} }
+        linear_term = np.sum(scores[histories, tags])
 
-            weights = optimal_params[0]
-            score = optimal_params[1]
-            grad = optimal_params[2]["grad"]
-            print(f"\tScore: {score}\n"
-                  f"\tGradient norm: {np.linalg.norm(grad)}")
+        # at position i: log {\sum_{y' \in Y} { e^{v^T f(x_{i}, y' } }
+        max_scores = scores.max(axis=1, keepdims=True)
+        log_denominators = max_scores + np.log(np.exp(scores - max_scores).sum(axis=1, keepdims=True))
+        normalization_term = np.sum(log_denominators)
+        probabilities = np.exp(scores - log_denominators)
 
-            self.weights = weights
-            self.save_to_pickle()  # Save the new weights
+        # The empirical and the expected counts of each (observation, tag) pair
+        gold = sp.csr_matrix((np.ones(len(tags)), (histories, tags)), shape=(len(tags), number_of_tags))
+        empirical_counts = np.zeros(len(weights))
+        empirical_counts[features] = (observations.T @ gold)[rows, columns]
+        expected_counts = np.zeros(len(weights))
+        expected_counts[features] = (observations.T @ probabilities)[rows, columns]
 
-            if np.linalg.norm(grad) < epsilon:  # Check the stop condition
-                break
+        # \frac{1}{2} \lambda {\norm v \norm}^2
+        regularization_term = 1 / 2 * regularization * np.linalg.norm(weights) ** 2
 
-            batch_size = int(min(batch_size * 1.5, 500))
+        # \lambda v
+        regularization_gradient = regularization * weights
 
+        likelihood = linear_term - normalization_term - regularization_term
+        gradient = empirical_counts - expected_counts - regularization_gradient
+        return -likelihood, -gradient
+
+    @staticmethod
+    def check_gradient(weights: np.ndarray, args: tuple, number_of_directions: int = 5,
+                       epsilon: float = 1e-6, objective=None) -> float:
+        """
+        Compare the gradient of the objective to finite differences along random directions
+
+        :param weights: The weights vector to check the gradient at
+        :param args: The arguments of the objective (after the weights)
+        :param number_of_directions: The number of random directions to check
+        :param epsilon: The step size of the finite differences
+        :param objective: The objective function to check (Optimizer.objective by default)
+        :return: The maximal relative error of the directional derivative
+        """
+        objective = objective or Optimizer.objective
+        _, gradient = objective(weights, *args)
+        max_error = 0
+        for _ in range(number_of_directions):
+            direction = np.random.normal(0, 1, len(weights))
+            direction /= np.linalg.norm(direction)
+            forward, _ = objective(weights + epsilon * direction, *args)
+            backward, _ = objective(weights - epsilon * direction, *args)
+            numeric = (forward - backward) / (2 * epsilon)
+            analytic = gradient @ direction
+            max_error = max(max_error, abs(numeric - analytic) / max(1e-8, abs(numeric) + abs(analytic)))
+        return max_error
+
+    def _prepare_batch(self, batch_size: int, use_cache: bool) -> Tuple[sp.csr_matrix, np.ndarray]:
+        """
+        Prepare the matrices of a batch of random lines
+
+        :param batch_size: The number of lines in the batch
+        :param use_cache: If True, slices the cached matrices, otherwise extracts the features of the histories
+        :return: The observations and the tags of the histories in the batch (see _preprocess_factored)
+        """
+        if not use_cache:
+            return self._preprocess_factored(self.history_handler.create_histories(batch_size, "RANDOM"))
+
+        observations, tags, line_offsets = self.load_training_data()
+        number_of_lines = len(line_offsets) - 1
+        lines = np.random.choice(number_of_lines, min(batch_size, number_of_lines), replace=False)
+        rows = TrainingCache.line_rows(line_offsets, lines)
+        return observations[rows], np.array(tags[rows])
+
+    @instrumentation.timed("optimize")
+    def optimize(self, use_cache: bool = True, prefetch: int = 2):
+        """
+        Optimize the weights vector using (Stochastic) Gradient Descent
+
+        :param use_cache: If True, slices the batches from the cached matrices of the corpus,
+                          otherwise extracts the features of each batch
+        :param prefetch: The number of batches to prepare in a background process while optimizing
+                         (bounds the memory), if 0 then prepares each batch before optimizing it
+        :return: The calculated weights vector
+        """
+        number_of_iterations = 30
+        epsilon = 0  # .001  # The gradient threshold (if the norm of the gradient is less than epsilon, stops)
+        table = (self.factored_features.rows, self.factored_features.columns, self.factored_features.features)
+
+        # The number of lines in each batch (about 25 histories per line)
+        batch_sizes = [int(min(200 * 1.5 ** iteration, 500)) for iteration in range(number_of_iterations)]
+
+        if use_cache:
+            self.load_training_data()  # Create the cache before starting
+        batches = BatchPrefetcher(self, batch_sizes, use_cache, prefetch)
+        try:
+            for iteration, batch_size in enumerate(batch_sizes):
+                w_0 = self.weights  # The current weights vector
+
+                # Get random histories for this batch
+                observations, tags, preparation_time, waiting_time = batches.next()
+                print(f"Iteration {iteration}\n"
+                      f"\tNumber of histories: {len(tags)}\n"
+                      f"\tPreparation time: {preparation_time : .3f} sec (waited {waiting_time : .3f} sec)")
+                # The argument for the objective function
+                args = (observations, tags, table, len(self.factored_features.tags), 0.5)
+
+                # Gradient Descent for the current batch
+                optimal_params = minimize(func=Optimizer.factored_objective, x0=w_0, args=args,
+                                          maxiter=10 * int(np.sqrt(batch_size)))
+
+                weights = optimal_params[0]
+                score = optimal_params[1]
+                grad = optimal_params[2]["grad"]
+                print(f"\tScore: {score}\n"
+                      f"\tGradient norm: {np.linalg.norm(grad)}")
+
+                self.weights = weights
+                self.save_to_pickle()  # Save the new weights
+
+                if np.linalg.norm(grad) < epsilon:  # Check the stop condition
+                    break
+        finally:
+            batches.close()
+
+        print(f"Preparation time: {batches.preparation_time : .3f} sec, "
+              f"hidden: {batches.preparation_time - batches.waiting_time : .3f} sec")
+        return self.weights
+
+    @instrumentation.timed("optimize")
+    def optimize_full(self, max_iterations: int = 500, regularization: float = 0.5, processes: int = 1) -> np.ndarray:
+        """
+        Optimize the weights vector over all of the histories at once, using the tag-factored representation
+
+        :param max_iterations: The maximal number of iterations of L-BFGS
+        :param regularization: The regularization coefficient
+        :param processes: The number of worker processes to split the histories between
+                          (if None, uses all of the cores, if 1 calculates the objective in this process)
+        :return: The calculated weights vector
+        """
+        observations, tags, _ = self.load_training_data()
+        print(f"Number of histories: {len(tags)}\n"
+              f"Number of observations: {self.factored_features.number_of_observations}")
+
+        table = (self.factored_features.rows, self.factored_features.columns, self.factored_features.features)
+        if processes == 1:
+            args = (observations, tags, table, len(self.factored_features.tags), regularization)
+            optimal_params = minimize(func=Optimizer.factored_objective, x0=self.weights, args=args,
+                                      maxiter=max_iterations)
+        else:
+            with ShardedObjective(observations, tags, table, len(self.factored_features.tags),
+                                  self.feature_id.number_of_features, regularization, processes) as objective:
+                optimal_params = minimize(func=objective, x0=self.weights, maxiter=max_iterations)
+
+        self.weights = optimal_params[0]
+        print(f"Score: {optimal_params[1]}\n"
+              f"Gradient norm: {np.linalg.norm(optimal_params[2]['grad'])}")
+        self.save_to_pickle()  # Save the new weights
+        return self.weights
+
+    @instrumentation.timed("optimize")
+    def optimize_online(self, epochs: int = 3, batch_size: int = 20, learning_rate: float = 0.5,
+                        regularization: float = 0.5, checkpoint_every: int = 500) -> np.ndarray:
+        """
+        Optimize the weights vector using minibatch AdaGrad over shuffled lines \n
+        Each update touches only the features of the observations in the minibatch,
+        the L2 regularization of the other features is applied lazily (when they are touched again)
+
+        :param epochs: The number of passes over the corpus
+        :param batch_size: The number of lines in each minibatch
+        :param learning_rate: The base learning rate (divided per feature by the root of its accumulated gradients)
+        :param regularization: The regularization coefficient (of the full-corpus objective)
+        :param checkpoint_every: The number of minibatches between saving the weights
+        :return: The calculated weights vector
+        """
+        observations, tags, line_offsets = self.load_training_data()
+        number_of_lines = len(line_offsets) - 1
+        number_of_tags = len(self.factored_features.tags)
+
+        # The table sorted by observation, so the entries of each observation are contiguous
+        order = np.argsort(self.factored_features.rows, kind="stable")
+        entry_rows = self.factored_features.rows[order]
+        entry_columns = self.factored_features.columns[order]
+        entry_features = self.factored_features.features[order]
+        entry_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(entry_rows, minlength=self.factored_features.number_of_observations))])
+
+        weights = np.array(self.weights, dtype=np.float64)
+        squared_gradients = np.full(len(weights), 0.1)  # The AdaGrad accumulators
+        last_step = np.zeros(len(weights), dtype=np.int64)  # The step the regularization was applied until
+        decay = regularization / len(tags)  # The regularization of a single step (the corpus is len(tags) histories)
+        step = 0
+
+        def regularize(features: np.ndarray, until: int):
+            # The learning rate of a feature does not change while it is not touched
+            rates = learning_rate / np.sqrt(squared_gradients[features])
+            weights[features] *= (1 - rates * decay) ** (until - last_step[features])
+            last_step[features] = until
+
+        for epoch in range(epochs):
+            total_loss = 0
+            lines = np.random.permutation(number_of_lines)
+            for start in range(0, number_of_lines, batch_size):
+                rows = TrainingCache.line_rows(line_offsets, lines[start: start + batch_size])
+                batch = observations[rows]
+
+                # Restrict the batch and the table to the active observations
+                active = np.unique(batch.indices)
+                local_batch = sp.csr_matrix((batch.data, np.searchsorted(active, batch.indices), batch.indptr),
+                                            shape=(len(rows), len(active)))
+                entries = TrainingCache.line_rows(entry_offsets, active)
+                features = entry_features[entries]
+                local_table = (np.searchsorted(active, entry_rows[entries]), entry_columns[entries],
+                               np.arange(len(entries)))
+
+                regularize(features, step + 1)
+                loss, gradient = Optimizer.factored_objective(weights[features], local_batch, tags[rows],
+                                                              local_table, number_of_tags, 0)
+                gradient /= len(rows)
+                squared_gradients[features] += gradient ** 2
+                weights[features] -= learning_rate / np.sqrt(squared_gradients[features]) * gradient
+
+                total_loss += loss
+                step += 1
+                if step % checkpoint_every == 0:
+                    regularize(np.arange(len(weights)), step)
+                    self.weights = weights.copy()
+                    self.save_to_pickle()
+
+            regularize(np.arange(len(weights)), step)
+            print(f"Epoch {epoch}\n"
+                  f"\tMean loss: {total_loss / len(tags)}")
+
+        self.weights = weights
+        self.save_to_pickle()  # Save the new weights
         return self.weights
 
     def initialize_weight(self):
         """
         Initialize the weights (from file if exists)
         """
+        if self.feature_id.bundle is not None and self.feature_id.bundle.path == self.path:
+            # The weights of a model bundle (copied, since they are mapped read-only)
+            self.weights = np.array(self.feature_id.bundle.weights)
+            return
         try:
             # If the file exists, read the weights from the file
             weights = np.load(self.path, allow_pickle=True)
@@ -147,7 +424,17 @@ class Optimizer:
 
     def save_to_pickle(self):
         """
-        Save the current weights as a pickle file
-        :return:
+        Save the current weights as a pickle file \n
+        If the path holds a model bundle (the weights were read from it), the bundle is written back instead,
+        so the features it holds are kept
         """
+        if os.path.exists(self.path) and ModelBundle.is_bundle(self.path):
+            self.save_bundle(self.path)
+            return
         self.weights.dump(self.path)
+
+    def save_bundle(self, path: str):
+        """
+        Save the features and the current weights as a model bundle (see ModelBundle)
+        """
+        self.feature_id.save_bundle(path, self.weights)
@@ -0,0 +1,122 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+from multiprocessing import Pipe, Process, shared_memory
+from multiprocessing.connection import Connection
+from typing import Tuple
+from ..Profiling import instrumentation
+
+
+def _objective_worker(connection: Connection, observations: sp.csr_matrix, tags: np.ndarray,
+                      table: Tuple[np.ndarray, np.ndarray, np.ndarray], number_of_tags: int,
+                      weights_name: str, gradients_name: str, index: int, number_of_features: int) -> None:
+    from ..Train.Optimizer import Optimizer
+
+    weights_memory = shared_memory.SharedMemory(name=weights_name)
+    gradients_memory = shared_memory.SharedMemory(name=gradients_name)
+    weights = np.ndarray(number_of_features, dtype=np.float64, buffer=weights_memory.buf)
+    gradient = np.ndarray((number_of_features,), dtype=np.float64, buffer=gradients_memory.buf,
+                          offset=index * number_of_features * 8)
+    try:
+        # Wait for a request, calculate the objective of the shard at the shared weights and report back
+        while connection.recv() is not None:
+            loss, gradient[:] = Optimizer.factored_objective(weights, observations, tags, table, number_of_tags, 0)
+            connection.send(loss)
+    finally:
+        del weights, gradient
+        weights_memory.close()
+        gradients_memory.close()
+
+
+class ShardedObjective:
+    """
+    Calculates the (factored) objective over all of the histories, split into shards held by worker processes \n
+    The weights are broadcast through shared memory, each worker writes the gradient of its shard to shared memory
+    and the results are summed (with the regularization) by the driver
+    """
+
+    join_timeout = 5  # The time (in seconds) to wait for each worker to stop
+
+    def __init__(self, observations: sp.csr_matrix, tags: np.ndarray, table: Tuple[np.ndarray, np.ndarray, np.ndarray],
+                 number_of_tags: int, number_of_features: int, regularization: float, processes: int = None):
+        """
+        Create a ShardedObjective object (starts the worker processes)
+
+        :param observations: The observations of the histories (a row per history)
+        :param tags: The index of the tag of each history
+        :param table: The feature of each (observation, tag) pair (see Optimizer.factored_objective)
+        :param number_of_tags: The number of tags
+        :param number_of_features: The number of features (the length of the weights vector)
+        :param regularization: The regularization coefficient
+        :param processes: The number of worker processes (if None, uses all of the cores)
+        """
+        self.number_of_features = number_of_features
+        self.regularization = regularization
+        processes = max(1, min(processes or os.cpu_count() or 1, len(tags)))
+
+        self.weights_memory = shared_memory.SharedMemory(create=True, size=number_of_features * 8)
+        self.gradients_memory = shared_memory.SharedMemory(create=True, size=processes * number_of_features * 8)
+        self.weights = np.ndarray(number_of_features, dtype=np.float64, buffer=self.weights_memory.buf)
+        self.gradients = np.ndarray((processes, number_of_features), dtype=np.float64,
+                                    buffer=self.gradients_memory.buf)
+
+        # Each worker holds a contiguous shard of the histories
+        bounds = np.linspace(0, len(tags), processes + 1).astype(int)
+        self.connections = []
+        self.workers = []
+        for index, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            connection, worker_connection = Pipe()
+            worker = Process(target=_objective_worker, daemon=True,
+                             args=(worker_connection, observations[start:end], tags[start:end], table,
+                                   number_of_tags, self.weights_memory.name, self.gradients_memory.name, index,
+                                   number_of_features))
+            worker.start()
+            self.connections.append(connection)
+            self.workers.append(worker)
+
+    @instrumentation.timed("objective", "objective_evaluations")
+    def __call__(self, weights: np.ndarray) -> Tuple[float, np.ndarray]:
+        """
+        Calculate the objective and the gradient at the given weights vector
+
+        :param weights: The weights vector
+        :return: The negative likelihood and the negative gradient (see Optimizer.factored_objective)
+        """
+        self.weights[:] = weights
+        for connection in self.connections:
+            connection.send(True)
+        loss = sum(connection.recv() for connection in self.connections)
+        gradient = self.gradients.sum(axis=0)
+
+        # The regularization is added once (and not per shard)
+        loss += 1 / 2 * self.regularization * np.linalg.norm(weights) ** 2
+        gradient += self.regularization * weights
+        return loss, gradient
+
+    def close(self) -> None:
+        """
+        Stop the worker processes and release the shared memory
+        """
+        try:
+            for connection in self.connections:
+                try:
+                    connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass  # The worker has already died
+            for worker in self.workers:
+                worker.join(timeout=self.join_timeout)
+                if worker.is_alive():
+                    worker.terminate()
+        finally:
+            # The shared memory is always released, so a failed run does not leak segments
+            del self.weights, self.gradients
+            self.weights_memory.close()
+            self.weights_memory.unlink()
+            self.gradients_memory.close()
+            self.gradients_memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import numpy as np
+import scipy.sparse as sp
+from typing import Iterable, Optional, Tuple
+from ..FeatureExtraction.FeatureID import FeatureID
+
+
+class TrainingCache:
+    """
+    Persists the preprocessed training matrices on disk, so they are created once per (corpus, features, window) \n
+    Each array is saved as a .npy file and loaded memory-mapped
+    """
+
+    array_names = ("indptr", "indices", "data", "tags", "line_offsets")
+
+    def __init__(self, directory: str = "cache"):
+        """
+        Create a TrainingCache object
+
+        :param directory: The directory to keep the cached matrices in
+        """
+        self.directory = directory
+
+    @staticmethod
+    def key(corpus_path: str, feature_id: FeatureID, window_size: int, tags: Iterable[str]) -> str:
+        """
+        Create the key of the training matrices
+
+        :param corpus_path: The path to the corpus file
+        :param feature_id: The features
+        :param window_size: The window size of the histories
+        :param tags: The tags (in the order of their indices)
+        :return: A hash of the content of the corpus file, the features, the window size and the tags
+        """
+        digest = hashlib.sha1()
+        with open(corpus_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        if feature_id.hashed_features:
+            hashed = feature_id.features_dict
+            digest.update(f"hashed{hashed.number_of_observations}{hashed.signed}{hashed.tags}".encode())
+        else:
+            for key, value in feature_id.features_dict.items():
+                digest.update(f"{key.words}{key.tags}{key.next_words}{value}".encode())
+        digest.update(f"{window_size}{list(tags)}".encode())
+        return digest.hexdigest()
+
+    def load(self, key: str) -> Optional[Tuple[sp.csr_matrix, np.ndarray, np.ndarray]]:
+        """
+        Load the cached matrices (memory-mapped)
+
+        :param key: The key of the matrices (see key)
+        :return: The observations, the tags and the line offsets (see save), or None if they are not cached
+        """
+        directory = os.path.join(self.directory, key)
+        paths = [os.path.join(directory, f"{name}.npy") for name in TrainingCache.array_names]
+        shape_path = os.path.join(directory, "shape.npy")  # Saved last
+        if not all(os.path.exists(path) for path in paths + [shape_path]):
+            return None
+
+        indptr, indices, data, tags, line_offsets = (np.load(path, mmap_mode="r") for path in paths)
+        number_of_observations = int(np.load(shape_path)[1])
+        observations = sp.csr_matrix((data, indices, indptr),
+                                     shape=(len(tags), number_of_observations))
+        return observations, tags, line_offsets
+
+    def save(self, key: str, observations: sp.csr_matrix, tags: np.ndarray, line_offsets: np.ndarray) -> None:
+        """
+        Save the matrices to the cache
+
+        :param key: The key of the matrices (see key)
+        :param observations: The observations of all of the histories (a row per history)
+        :param tags: The index of the tag of each history
+        :param line_offsets: The index of the first history of each line (and the number of histories at the end)
+        """
+        directory = os.path.join(self.directory, key)
+        os.makedirs(directory, exist_ok=True)
+        # The values are 1 (or sums of signs, in the feature-hashing mode)
+        arrays = (observations.indptr, observations.indices, observations.data, tags, line_offsets)
+        for name, array in zip(TrainingCache.array_names, arrays):
+            np.save(os.path.join(directory, f"{name}.npy"), np.asarray(array, dtype=np.int32))
+        np.save(os.path.join(directory, "shape.npy"), np.array(observations.shape))
+
+    @staticmethod
+    def line_rows(line_offsets: np.ndarray, lines: np.ndarray) -> np.ndarray:
+        """
+        Get the indices of the histories of the given lines
+
+        :param line_offsets: The index of the first history of each line (and the number of histories at the end)
+        :param lines: The indices of the lines
+        :return: The indices of the histories (rows), line by line
+        """
+        starts = np.asarray(line_offsets[lines], dtype=np.int64)
+        lengths = np.asarray(line_offsets[lines + 1], dtype=np.int64) - starts
+        line_starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.repeat(starts, lengths) + np.arange(lengths.sum()) - line_starts
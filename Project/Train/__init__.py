@@ -1 +1,2 @@
 from ..Train.Optimizer import Optimizer
+from ..Train.ModelCompressor import ModelCompressor
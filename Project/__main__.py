@@ -0,0 +1,3 @@
+from Project.cli import main
+
+main()
@@ -0,0 +1,376 @@
+"""
+The command line interface of the tagger (run from the directory above the package):
+
+    python -m Project extract-features --corpus Data/train1.wtag --output features.json
+    python -m Project train --corpus Data/train1.wtag --features features.json --weights weights.pkl
+    python -m Project compress --model model.bundle --output small.bundle --corpus Data/train1.wtag --test Data/test1.wtag
+    python -m Project tag --model model.bundle --corpus Data/train1.wtag --input sentences.words --output tagged.wtag
+    python -m Project serve --model model.bundle --corpus Data/train1.wtag --port 8765
+    python -m Project evaluate --model model.bundle --corpus Data/train1.wtag --test Data/test1.wtag --json report.json
+    python -m Project bench startup --model model.bundle --corpus Data/train1.wtag
+    python -m Project bench run --features features.json --weights weights.pkl --corpus Data/train1.wtag --output new.json
+    python -m Project bench compare --results new.json
+    python -m Project --profile profile.json --trace-memory evaluate ...  (the counters and the stage timers)
+
+Only the standard library is imported here, each command imports what it needs (the tag path needs only NumPy and
+SciPy, pandas and the plotting libraries are imported only for plotting)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+# The time (in seconds) a tag command may take to start (import, load the model and tag a sentence)
+TAG_STARTUP_TARGET = 2.0
+
+# The modules the tag path must not import
+HEAVY_MODULES = ("pandas", "matplotlib", "seaborn")
+
+
+def _load_model(model_path: str, weights_path: Optional[str]):
+    """
+    Load the features and the weights of a model
+
+    :param model_path: The path to a model bundle or a features json file
+    :param weights_path: The path to the pickled weights (ignored for a bundle)
+    :return: The FeatureID object and the weights
+    """
+    import numpy as np
+    from .FeatureExtraction import FeatureID
+
+    feature_id = FeatureID.read_features(model_path)
+    if feature_id.bundle is not None:
+        return feature_id, feature_id.bundle.weights
+    if weights_path is None:
+        raise SystemExit("--weights is required with a features json file")
+    return feature_id, np.load(weights_path, allow_pickle=True)
+
+
+def _create_inference(args: argparse.Namespace, precompute: bool = True):
+    from .FeatureExtraction import HistoryHandler, TagDictionary
+    from .Inference import Inference
+
+    feature_id, weights = _load_model(args.model, args.weights)
+    history_handler = HistoryHandler(args.corpus, args.window_size)
+    tag_dictionary = TagDictionary(history_handler.text_editor) if args.tag_dictionary else None
+    return Inference(feature_id, weights, history_handler, tag_dictionary, precompute)
+
+
+# <editor-fold desc="Commands">
+def extract_features(args: argparse.Namespace) -> None:
+    from .FeatureExtraction import FeatureCounts, FeatureID, FeatureStatistics, HistoryHandler
+
+    start = time.perf_counter()
+    if args.counts is not None and os.path.exists(args.counts):
+        # Choose the features from the saved counts (without counting again)
+        feature_id = FeatureCounts.load(args.counts).feature_id()
+    else:
+        history_handler = HistoryHandler(args.corpus, args.window_size)
+        feature_statistics = FeatureStatistics(history_handler.create_histories(None, "ALL"), args.processes)
+        if args.counts is not None:
+            FeatureCounts.from_statistics(feature_statistics).save(args.counts)
+        feature_id = FeatureID(feature_statistics)
+
+    feature_id.save_feature_as_json(args.output)
+    print(f"Extracted {feature_id.number_of_features} features in {time.perf_counter() - start: .3f} sec")
+
+
+def train(args: argparse.Namespace) -> None:
+    from .FeatureExtraction import FeatureID, HistoryHandler
+    from .Train import Optimizer
+
+    feature_id = FeatureID.read_features(args.features)
+    history_handler = HistoryHandler(args.corpus, args.window_size, use_store=args.use_store)
+    optimizer = Optimizer(feature_id, history_handler, args.weights)
+
+    start = time.perf_counter()
+    if args.method == "batches":
+        optimizer.optimize()
+    elif args.method == "full":
+        optimizer.optimize_full(args.max_iterations, args.regularization, args.processes)
+    else:
+        optimizer.optimize_online(args.epochs, regularization=args.regularization)
+    print(f"Trained in {time.perf_counter() - start: .3f} sec")
+
+    if args.bundle is not None:
+        optimizer.save_bundle(args.bundle)
+
+
+def compress(args: argparse.Namespace) -> None:
+    from .Train import ModelCompressor
+
+    feature_id, weights = _load_model(args.model, args.weights)
+    compressor = ModelCompressor(feature_id, weights)
+    compressed = compressor.compress(args.threshold)
+    compressed[0].save_bundle(args.output, compressed[1])
+    print(f"Kept {compressed[0].number_of_features} of {feature_id.number_of_features} features")
+
+    if args.test is not None:
+        if args.corpus is None:
+            raise SystemExit("--corpus is required with --test")
+        report = compressor.report(compressed, args.corpus, args.test, args.window_size, args.beam_size,
+                                   args.max_sentences)
+        print(json.dumps(report, indent=2))
+        if args.json is not None:
+            with open(args.json, "w") as file:
+                json.dump(report, file, indent=2)
+
+
+def tag(args: argparse.Namespace) -> None:
+    from .Inference import StreamTagger
+
+    start = time.perf_counter()
+    if args.processes == 1:
+        # The observations of the words are computed on first use (starts faster)
+        inference = _create_inference(args, precompute=False)
+        counter = 0
+        with open(args.output, "w") as output:
+            for words in StreamTagger.read_sentences(args.input):
+                tags = inference.infer(words, args.beam_size, margin=args.margin) if words else tuple()
+                output.write(" ".join(f"{word}_{tag}" for word, tag in zip(words, tags)) + "\n")
+                counter += 1
+    else:
+        _, weights = _load_model(args.model, args.weights)
+        tagger = StreamTagger(args.model, args.corpus, weights, args.window_size, args.tag_dictionary,
+                              args.processes)
+        counter = tagger.tag_file(args.input, args.output, args.beam_size, args.margin)
+    print(f"Tagged {counter} sentences in {time.perf_counter() - start: .3f} sec", file=sys.stderr)
+
+
+def serve(args: argparse.Namespace) -> None:
+    from .Inference import TaggingServer
+
+    # The model is loaded once, and kept for all of the requests
+    server = TaggingServer(_create_inference(args), args.beam_size, args.margin, args.max_batch_size, args.max_delay)
+    address = args.socket if args.socket is not None else f"{args.host}:{args.port}"
+    print(f"Serving on {address}", file=sys.stderr)
+    try:
+        server.serve_forever(args.host, args.port, args.socket)
+    except KeyboardInterrupt:
+        pass
+
+
+def evaluate(args: argparse.Namespace) -> None:
+    from .Inference import Evaluation
+
+    evaluation = Evaluation(_create_inference(args), args.beam_size, args.margin)
+    report = evaluation.evaluate(args.test, args.max_sentences)
+    print(f"Accuracy: {report['accuracy'] * 100: .2f}%\n"
+          f"Macro F1: {report['macro_f1'] * 100: .2f}%\n"
+          f"Throughput: {report['tokens_per_sec']: .1f} tokens/sec, {report['sentences_per_sec']: .2f} sentences/sec")
+    for name, latencies in report["latency_by_length"].items():
+        print(f"\tLength {name}: " + ", ".join(f"{key} {value:.4g}" for key, value in latencies.items()))
+    if args.json is not None:
+        Evaluation.save_json(report, args.json)
+
+    if args.plot:
+        import numpy as np
+        import pandas as pd
+        from .main import plot_confusion_matrix
+
+        # The rows of the plotted matrix are the predicted tags (the columns are the real tags)
+        tags = report["confusion_matrix"]["tags"]
+        counts = np.array(report["confusion_matrix"]["counts"]).T
+        plot_confusion_matrix(pd.DataFrame(counts, index=tags, columns=tags))
+
+
+def bench_startup(args: argparse.Namespace) -> None:
+    """
+    Measure the startup time of the tag command (in a new interpreter) against TAG_STARTUP_TARGET
+    """
+    import tempfile
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "sentence.words")
+        with open(input_path, "w") as file:
+            file.write(f"{args.sentence}\n")
+        command = ["tag", "--model", args.model, "--corpus", args.corpus, "--input", input_path,
+                   "--output", os.path.join(directory, "sentence.wtag")]
+        if args.weights is not None:
+            command += ["--weights", args.weights]
+        if not args.tag_dictionary:
+            command += ["--no-tag-dictionary"]
+        command += ["--window-size", str(args.window_size)]
+        code = (f"import sys, json\n"
+                f"from {__package__}.cli import main\n"
+                f"main({command!r})\n"
+                f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))")
+
+        timings = []
+        heavy_modules = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", code], env=environment, check=True,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            timings.append(time.perf_counter() - start)
+            heavy_modules = json.loads(result.stdout.strip().splitlines()[-1])
+
+    report = {"startup_sec": min(timings), "target_sec": TAG_STARTUP_TARGET,
+              "passed": min(timings) <= TAG_STARTUP_TARGET and not heavy_modules, "heavy_modules": heavy_modules}
+    print(json.dumps(report, indent=2))
+    if not report["passed"]:
+        raise SystemExit(1)
+
+
+def bench_run(args: argparse.Namespace) -> None:
+    from .Benchmark import BenchmarkSuite
+    from .Benchmark.BenchmarkSuite import BASELINE_PATH
+
+    suite = BenchmarkSuite(args.features, args.weights, args.corpus, args.data, repeat=args.repeat)
+    results = suite.run()
+    if args.output is not None:
+        BenchmarkSuite.save(results, args.output)
+    if args.save_baseline:
+        BenchmarkSuite.save(results, BASELINE_PATH)
+
+
+def bench_compare(args: argparse.Namespace) -> None:
+    from .Benchmark import BenchmarkSuite
+
+    baseline = BenchmarkSuite.load() if args.baseline is None else BenchmarkSuite.load(args.baseline)
+    slowdowns = BenchmarkSuite.compare(baseline, BenchmarkSuite.load(args.results),
+                                       args.tolerance)
+    for name, base, new, ratio in slowdowns:
+        print(f"SLOWER {name}: {base * 1000: .2f} ms -> {new * 1000: .2f} ms ({ratio: .2f}x)")
+    if slowdowns:
+        raise SystemExit(1)
+    print(f"No slowdowns beyond {args.tolerance * 100: .0f}%")
+
+
+# </editor-fold>
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m Project", description="A MEMM part-of-speech tagger")
+    parser.add_argument("--profile", help="Collect the counters and the stage timers into this json file")
+    parser.add_argument("--trace-memory", action="store_true", help="Also trace the peak memory of each stage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_model_arguments(command: argparse.ArgumentParser) -> None:
+        command.add_argument("--model", required=True, help="A model bundle or a features json file")
+        command.add_argument("--weights", help="The pickled weights (when the model is a features json file)")
+        command.add_argument("--corpus", required=True, help="The corpus the model was trained on")
+        command.add_argument("--window-size", type=int, default=3)
+        command.add_argument("--no-tag-dictionary", dest="tag_dictionary", action="store_false")
+
+    def add_decoding_arguments(command: argparse.ArgumentParser) -> None:
+        command.add_argument("--beam-size", type=int, default=5, help="0 for exact Viterbi decoding")
+        command.add_argument("--margin", type=float, help="The margin of the adaptive beam")
+
+    command = commands.add_parser("extract-features", help="Count the features of a corpus and choose them")
+    command.add_argument("--corpus", required=True)
+    command.add_argument("--output", default="features.json")
+    command.add_argument("--counts", help="A directory to keep the raw counts in (reused if it exists)")
+    command.add_argument("--window-size", type=int, default=3)
+    command.add_argument("--processes", type=int, default=1, help="0 to use all of the cores")
+    command.set_defaults(function=extract_features)
+
+    command = commands.add_parser("train", help="Train the weights")
+    command.add_argument("--corpus", required=True)
+    command.add_argument("--features", required=True, help="A features json file or a model bundle")
+    command.add_argument("--weights", default="weights.pkl", help="The pickled weights (read and written)")
+    command.add_argument("--bundle", help="Also save the model as a bundle")
+    command.add_argument("--method", choices=("batches", "full", "online"), default="batches")
+    command.add_argument("--max-iterations", type=int, default=500)
+    command.add_argument("--epochs", type=int, default=3)
+    command.add_argument("--regularization", type=float, default=0.5)
+    command.add_argument("--processes", type=int, default=1, help="0 to use all of the cores")
+    command.add_argument("--window-size", type=int, default=3)
+    command.add_argument("--use-store", action="store_true", help="Read the corpus through a CorpusStore")
+    command.set_defaults(function=train)
+
+    command = commands.add_parser("compress", help="Prune the small weights and save a smaller model bundle")
+    command.add_argument("--model", required=True, help="A model bundle or a features json file")
+    command.add_argument("--weights", help="The pickled weights (when the model is a features json file)")
+    command.add_argument("--threshold", type=float, default=1e-3, help="The minimal absolute weight to keep")
+    command.add_argument("--output", required=True, help="The path of the compressed model bundle")
+    command.add_argument("--corpus", help="The corpus the model was trained on (for the report)")
+    command.add_argument("--test", help="A file of word_tag pairs to compare the models on")
+    command.add_argument("--max-sentences", type=int)
+    command.add_argument("--beam-size", type=int, default=5)
+    command.add_argument("--window-size", type=int, default=3)
+    command.add_argument("--json", help="Write the report to this json file")
+    command.set_defaults(function=compress)
+
+    command = commands.add_parser("tag", help="Tag a file of sentences (space separated words)")
+    add_model_arguments(command)
+    add_decoding_arguments(command)
+    command.add_argument("--input", required=True)
+    command.add_argument("--output", required=True)
+    command.add_argument("--processes", type=int, default=1, help="0 to use all of the cores")
+    command.set_defaults(function=tag)
+
+    command = commands.add_parser("serve", help="Tag sentences sent over TCP or a Unix socket (see TaggingServer)")
+    add_model_arguments(command)
+    add_decoding_arguments(command)
+    command.add_argument("--host", default="127.0.0.1")
+    command.add_argument("--port", type=int, default=8765)
+    command.add_argument("--socket", help="Listen on this Unix socket instead of TCP")
+    command.add_argument("--max-batch-size", type=int, default=32)
+    command.add_argument("--max-delay", type=float, default=0.005,
+                         help="The time (in seconds) to wait for more requests to batch together")
+    command.set_defaults(function=serve)
+
+    command = commands.add_parser("evaluate", help="Evaluate a model on a file of word_tag pairs")
+    add_model_arguments(command)
+    add_decoding_arguments(command)
+    command.add_argument("--test", required=True, help="A file of word_tag pairs")
+    command.add_argument("--max-sentences", type=int)
+    command.add_argument("--json", help="Write the report to this json file")
+    command.add_argument("--plot", action="store_true", help="Plot the confusion matrix")
+    command.set_defaults(function=evaluate)
+
+    command = commands.add_parser("bench", help="Benchmarks")
+    benchmarks = command.add_subparsers(dest="benchmark", required=True)
+    benchmark = benchmarks.add_parser("startup", help="Measure the startup time of the tag command")
+    add_model_arguments(benchmark)
+    benchmark.add_argument("--sentence", default="The tagger starts quickly .")
+    benchmark.add_argument("--repeat", type=int, default=3)
+    benchmark.set_defaults(function=bench_startup)
+
+    benchmark = benchmarks.add_parser("run", help="Run the benchmark suite over the tagged files")
+    benchmark.add_argument("--features", required=True, help="A features json file or a model bundle")
+    benchmark.add_argument("--weights", required=True, help="The pickled weights (or the model bundle)")
+    benchmark.add_argument("--corpus", required=True, help="The corpus the model was trained on")
+    benchmark.add_argument("--data", default="Data", help="The directory of the .wtag files")
+    benchmark.add_argument("--repeat", type=int, default=5)
+    benchmark.add_argument("--output", help="Write the results to this json file")
+    benchmark.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    benchmark.set_defaults(function=bench_run)
+
+    benchmark = benchmarks.add_parser("compare", help="Compare benchmark results with the baseline")
+    benchmark.add_argument("--results", required=True)
+    benchmark.add_argument("--baseline", help="The baseline results (the stored baseline by default)")
+    benchmark.add_argument("--tolerance", type=float, default=0.25, help="The allowed relative slowdown")
+    benchmark.set_defaults(function=bench_compare)
+
+    return parser
+
+
+def main(argv: List[str] = None) -> None:
+    args = create_parser().parse_args(argv)
+    if getattr(args, "processes", 1) == 0:
+        args.processes = None
+    if getattr(args, "beam_size", 1) == 0:
+        args.beam_size = None
+
+    if args.profile is None:
+        args.function(args)
+        return
+
+    from .Profiling import instrumentation
+
+    instrumentation.enable(args.trace_memory)
+    try:
+        args.function(args)
+    finally:
+        instrumentation.save_json(args.profile)
+        instrumentation.disable()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,17 @@
-from Project.FeatureExtraction import FeatureStatistics, FeatureID, HistoryHandler
+from Project.FeatureExtraction import FeatureStatistics, FeatureID, FeatureCounts, HistoryHandler
 from Project.Train import Optimizer
-from Project.Inference import Inference
+from Project.Inference import Inference, StreamTagger, Evaluation
 from os import path
 import numpy as np
-import seaborn as sn
-import pandas as pd
-import matplotlib.pyplot as plt
 import time
 
 
-def plot_confusion_matrix(matrix: pd.DataFrame):
+# The plotting libraries and pandas are imported only by the functions that use them (see cli.py)
+def plot_confusion_matrix(matrix: "pd.DataFrame"):
+    import seaborn as sn
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
     matrix.to_csv("confusion_matrix.csv", header=True)
     matrix_copy = matrix.copy()
     np.fill_diagonal(matrix_copy.values, 0)
@@ -22,46 +24,35 @@ def plot_confusion_matrix(matrix: pd.DataFrame):
     plt.show()
 
 
-def test_infer(inference: Inference):
-    accuracy = 0
-    counter = 0
-    sentence_counter = 0
-    max_sentences = 1000
+def test_infer(inference: Inference, test_path: str = r"Data/train2.wtag", max_sentences: int = 1000):
+    import pandas as pd
+
+    evaluation = Evaluation(inference, beam_size=5)
+    report = evaluation.evaluate(test_path, max_sentences)
+    Evaluation.save_json(report, "evaluation.json")
+    print(f"Accuracy: {report['accuracy'] * 100: .2f}%\n"
+          f"Timing:\n"
+          f"\tTokens per second: {report['tokens_per_sec']: .1f}\n"
+          f"\tSentences per second: {report['sentences_per_sec']: .2f}")
+
+    # The rows of the plotted matrix are the predicted tags (the columns are the real tags)
+    tags = report["confusion_matrix"]["tags"]
+    matrix = pd.DataFrame(np.array(report["confusion_matrix"]["counts"]).T, index=tags, columns=tags)
+    plot_confusion_matrix(matrix)
 
-    tags = inference.tags.difference([inference.start_symbol, inference.start_symbol])
-    matrix = pd.DataFrame(data=0, index=tags, columns=tags)
 
+def tag_unlabeled(input_path: str, output_path: str, weights: np.ndarray):
     start = time.time()
-    with open(r"Data/train2.wtag") as file:
-        for sentence in file:
-            split_list = (word_tag.split("_") for word_tag in sentence.strip("\n").split(" "))
-            words, tags = zip(*split_list)
-
-            predicted_tags = inference.infer(words, beam_size=5)
-            # print(f"real tags: {tags}\n"
-            #       f"predicted: {predicted_tags}\n")
-
-            for real_tag, predicted_tag in zip(tags, predicted_tags):
-                matrix[real_tag][predicted_tag] += 1
-                if real_tag == predicted_tag:
-                    accuracy += 1
-                counter += 1
-            sentence_counter += 1
-            if (10 * sentence_counter) % max_sentences == 0:
-                print(f"Finished {sentence_counter / max_sentences * 100}% of the predictions")
-                print(f"Accuracy: {accuracy / counter * 100: .2f}%")
-            if max_sentences <= sentence_counter:
-                break
+    tagger = StreamTagger(r"features.json", r"Data/train2.wtag", weights)
+    sentence_counter = tagger.tag_file(input_path, output_path, beam_size=5)
     end = time.time()
-    print(f"Timing:\n"
-          f"\tTotal time: {end - start : .3f} sec\n"
-          f"\tTime per sentence: {(end - start) / sentence_counter: .3f} sec/snt")
-    plot_confusion_matrix(matrix)
+    print(f"Tagged {sentence_counter} sentences in {end - start : .3f} sec")
 
 
 def main():
     file_path = r"Data/train2.wtag"
     features_file_path = r"features.json"
+    counts_directory = r"feature_counts"
 
     max_gram = 3
     optimize = False
@@ -71,8 +62,13 @@ def main():
     history_handler = HistoryHandler(file_path, max_gram)
     if path.exists(features_file_path):
         feature_id = FeatureID.read_features_from_json(features_file_path)
+    elif path.exists(counts_directory):
+        # Choose the features from the saved counts (the thresholds can be changed without counting again)
+        feature_id = FeatureCounts.load(counts_directory).feature_id()
+        feature_id.save_feature_as_json(features_file_path)
     else:
-        feature_statistics = FeatureStatistics(history_handler.create_histories(None, "ALL"))
+        feature_statistics = FeatureStatistics(history_handler.create_histories(None, "ALL"), processes=None)
+        FeatureCounts.from_statistics(feature_statistics).save(counts_directory)
         feature_id = FeatureID(feature_statistics)
 
         # Save the features as csv file
@@ -95,6 +91,10 @@ def main():
 
 
 def test_confusion_matrix():
+    import seaborn as sn
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
     matrix = pd.read_csv("confusion_matrix.csv", index_col=0, header=0)
     np.fill_diagonal(matrix.values, 0)
     indices = pd.DataFrame(data=matrix, index=matrix.index, columns=matrix.columns).sum().sort_values(
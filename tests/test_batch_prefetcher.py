@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from Project.Train.BatchPrefetcher import BatchPrefetcher
+
+
+class StubOptimizer:
+    """
+    Prepares empty batches, and fails on the batch of size 0
+    """
+
+    def __init__(self, exit_on_failure: bool = False):
+        self.exit_on_failure = exit_on_failure
+
+    def _prepare_batch(self, batch_size: int, use_cache: bool):
+        if batch_size == 0:
+            if self.exit_on_failure:
+                os._exit(1)
+            raise ValueError("empty batch")
+        return sp.csr_matrix((batch_size, 1)), np.zeros(batch_size, dtype=np.int32)
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_batches(prefetch):
+    batches = BatchPrefetcher(StubOptimizer(), [1, 2, 3], False, prefetch)
+    try:
+        assert [len(batches.next()[1]) for _ in range(3)] == [1, 2, 3]
+    finally:
+        batches.close()
+
+
+def test_producer_exception():
+    batches = BatchPrefetcher(StubOptimizer(), [1, 0, 1], False, 2)
+    try:
+        batches.next()
+        with pytest.raises(ValueError, match="empty batch"):
+            batches.next()
+    finally:
+        batches.close()
+
+
+def test_producer_stopped():
+    batches = BatchPrefetcher(StubOptimizer(exit_on_failure=True), [0, 1], False, 2)
+    try:
+        with pytest.raises(RuntimeError, match="stopped"):
+            batches.next()
+    finally:
+        batches.close()
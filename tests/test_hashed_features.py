@@ -0,0 +1,101 @@
+import os
+import numpy as np
+import pytest
+from Project.FeatureExtraction import FeatureID, HashedFeatures, HistoryHandler, Key
+from Project.Inference import Inference
+from Project.Train import Optimizer
+from tests.test_objective import DUMMY_PATH, create_arguments
+
+
+@pytest.fixture(scope="module")
+def history_handler():
+    return HistoryHandler(DUMMY_PATH, 3)
+
+
+@pytest.fixture(scope="module")
+def histories(history_handler):
+    return history_handler.create_histories(None, "ALL")
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["unsigned", "signed"])
+def feature_id(history_handler, request):
+    # Small enough for the observations to collide
+    return FeatureID.hashed(sorted(history_handler.tags), 2 ** 12, request.param)
+
+
+def test_lookup(history_handler):
+    hashed = HashedFeatures(sorted(history_handler.tags), 2 ** 12, signed=True)
+    key = Key(("dog",), ("NN",), 1)
+    assert key in hashed
+    assert hashed.lookup(key) == hashed.lookup(Key(("dog",), ("NN",), 1))
+    assert 0 <= hashed[key] < hashed.size
+    assert Key(("dog",), ("NOT_A_TAG",), 1) not in hashed
+    assert hashed.get(Key(("dog",), ("NOT_A_TAG",), 1)) is None
+
+
+def test_objectives_agree(feature_id, history_handler, histories, tmp_path):
+    arguments, factored_arguments = create_arguments(feature_id, history_handler, histories, str(tmp_path))
+    weights = np.random.RandomState(0).normal(0, 0.5, feature_id.number_of_features)
+
+    loss, gradient = Optimizer.objective(weights, *arguments)
+    factored_loss, factored_gradient = Optimizer.factored_objective(weights, *factored_arguments)
+    assert factored_loss == pytest.approx(loss, rel=1e-9)
+    np.testing.assert_allclose(factored_gradient, gradient, rtol=1e-9, atol=1e-9)
+
+    np.random.seed(1)
+    assert Optimizer.check_gradient(weights, factored_arguments, objective=Optimizer.factored_objective) < 1e-4
+
+
+def test_training_data(feature_id, history_handler, tmp_path):
+    optimizer = Optimizer(feature_id, history_handler, str(tmp_path / "weights.pkl"), str(tmp_path / "cache"))
+    observations, tags, line_offsets = optimizer.load_training_data()
+    assert observations.shape == (line_offsets[-1], feature_id.features_dict.number_of_observations)
+    assert observations.nnz
+
+    # The data is learned from (the gradient of the likelihood is not zero)
+    table = (optimizer.factored_features.rows, optimizer.factored_features.columns,
+             optimizer.factored_features.features)
+    _, gradient = Optimizer.factored_objective(np.zeros(feature_id.number_of_features), observations, tags, table,
+                                               len(optimizer.factored_features.tags), 0)
+    assert np.abs(gradient).max() > 0
+
+
+def test_decoders_agree(feature_id, history_handler):
+    weights = np.random.RandomState(2).normal(0, 1, feature_id.number_of_features)
+    inference = Inference(feature_id, weights, history_handler)
+    for words in [("The", "dog", "barks", "."), ("Treasury", "is", "still", "working", "out", "the", "details")]:
+        assert inference.infer(words, 5) == inference.infer(words, 5, factored=False)
+        assert len(inference.infer(words, None)) == len(words)
+
+
+def test_bucket_without_sign_bit(history_handler):
+    from Project.FeatureExtraction.HashedFeatures import _observation_digest
+
+    hashed = HashedFeatures(sorted(history_handler.tags), 2 ** 12, signed=True)
+    for word in ["dog", "cat", "runs", "The", "."]:
+        observation = ((word,), tuple(), tuple())
+        value = _observation_digest(observation)
+        # The bucket does not depend on the sign bit
+        assert hashed.observation_bucket(observation) == \
+            ((value & ((1 << 63) - 1)) % hashed.number_of_observations, -1 if value >> 63 else 1)
+
+
+@pytest.mark.parametrize("file_name", ["model.bundle", "features.json"])
+def test_save_and_load(feature_id, history_handler, tmp_path, file_name):
+    weights = np.random.RandomState(3).normal(0, 1, feature_id.number_of_features)
+    path = str(tmp_path / file_name)
+    if file_name.endswith(".bundle"):
+        feature_id.save_bundle(path, weights)
+    else:
+        feature_id.save_feature_as_json(path)
+
+    loaded = FeatureID.read_features(path)
+    assert loaded.hashed_features
+    assert loaded.features_dict.parameters == feature_id.features_dict.parameters
+    assert loaded.number_of_features == feature_id.number_of_features
+    if loaded.bundle is not None:
+        np.testing.assert_array_equal(loaded.bundle.weights, weights)
+
+    words = ("The", "dog", "barks", ".")
+    assert Inference(loaded, weights, history_handler).infer(words, 5) == \
+        Inference(feature_id, weights, history_handler).infer(words, 5)
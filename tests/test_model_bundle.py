@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pytest
+from Project.FeatureExtraction import FeatureCounts, FeatureID, FeatureStatistics, HistoryHandler, ModelBundle
+from Project.Train import Optimizer
+
+DUMMY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Project", "Data",
+                          "dummy.wtag")
+
+
+@pytest.fixture(scope="module")
+def history_handler():
+    return HistoryHandler(DUMMY_PATH, 3)
+
+
+@pytest.fixture
+def bundle_path(history_handler, tmp_path):
+    feature_id = FeatureCounts.from_statistics(FeatureStatistics(history_handler.create_histories())).feature_id()
+    path = str(tmp_path / "model.bundle")
+    feature_id.save_bundle(path, np.arange(feature_id.number_of_features, dtype=np.float64))
+    return path
+
+
+def test_read_bundle(bundle_path):
+    feature_id = FeatureID.read_features(bundle_path)
+    assert feature_id.bundle is not None
+    for key, feature in list(feature_id.features_dict.items())[:50]:
+        assert feature_id.features_dict.get(key) == feature
+    np.testing.assert_array_equal(feature_id.bundle.weights, np.arange(feature_id.number_of_features))
+
+
+def test_checkpoint_keeps_bundle(bundle_path, history_handler, tmp_path):
+    feature_id = FeatureID.read_features(bundle_path)
+    optimizer = Optimizer(feature_id, history_handler, bundle_path, str(tmp_path / "cache"))
+    np.testing.assert_array_equal(optimizer.weights, np.arange(feature_id.number_of_features))
+
+    optimizer.weights = optimizer.weights + 1
+    optimizer.save_to_pickle()
+    assert ModelBundle.is_bundle(bundle_path)
+    np.testing.assert_array_equal(ModelBundle(bundle_path).weights, np.arange(feature_id.number_of_features) + 1)
+    # The features are still read from the bundle which was replaced
+    assert len(feature_id.features_dict) == feature_id.number_of_features
+
+
+def test_decoder_tables(bundle_path, history_handler):
+    from Project.Inference import ScoreTables
+
+    # The same features, as a regular dictionary
+    feature_id = FeatureID()
+    feature_id.features_dict = dict(FeatureID.read_features(bundle_path).features_dict.items())
+    feature_id.id_counter = len(feature_id.features_dict)
+    bundle_feature_id = FeatureID.read_features(bundle_path)
+    weights = np.array(bundle_feature_id.bundle.weights)
+    tags = sorted(history_handler.tags)
+
+    score_tables = ScoreTables(feature_id, weights, tags, 3)
+    bundle_score_tables = ScoreTables(bundle_feature_id, weights, tags, 3)
+    assert feature_id.observation_index.table == bundle_feature_id.observation_index.table
+    # The keys of the bundle were not decoded
+    assert bundle_feature_id.features_dict._dictionary is None
+
+    for transition, bundle_transition in zip(score_tables.transitions, bundle_score_tables.transitions):
+        np.testing.assert_array_equal(bundle_transition, transition)
+    assert bundle_score_tables.emissions.keys() == score_tables.emissions.keys()
+    for context, (tag_indices, context_weights) in score_tables.emissions.items():
+        np.testing.assert_array_equal(bundle_score_tables.emissions[context][0], tag_indices)
+        np.testing.assert_array_equal(bundle_score_tables.emissions[context][1], context_weights)
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import pytest
+from multiprocessing import shared_memory
+from Project.FeatureExtraction import FeatureCounts, FeatureStatistics, HistoryHandler
+from Project.Train import Optimizer
+
+DUMMY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Project", "Data",
+                          "dummy.wtag")
+
+
+@pytest.fixture(scope="module")
+def history_handler():
+    return HistoryHandler(DUMMY_PATH, 3)
+
+
+@pytest.fixture(scope="module")
+def histories(history_handler):
+    return history_handler.create_histories(None, "ALL")
+
+
+@pytest.fixture(scope="module")
+def feature_id(histories):
+    return FeatureCounts.from_statistics(FeatureStatistics(histories)).feature_id()
+
+
+def create_arguments(feature_id, history_handler, histories, directory):
+    """
+    :return: The arguments of Optimizer.objective and of Optimizer.factored_objective (after the weights)
+    """
+    optimizer = Optimizer(feature_id, history_handler, os.path.join(directory, "weights.pkl"),
+                          os.path.join(directory, "cache"))
+    factored_features = optimizer.factored_features
+    observations, tags = optimizer._preprocess_factored(histories)
+    return ((*optimizer._preprocess_histories(histories), 0.5),
+            (observations, tags, (factored_features.rows, factored_features.columns, factored_features.features),
+             len(factored_features.tags), 0.5))
+
+
+def test_objectives_agree(feature_id, history_handler, histories, tmp_path):
+    arguments, factored_arguments = create_arguments(feature_id, history_handler, histories, str(tmp_path))
+    weights = np.random.RandomState(0).normal(0, 0.5, feature_id.number_of_features)
+
+    loss, gradient = Optimizer.objective(weights, *arguments)
+    factored_loss, factored_gradient = Optimizer.factored_objective(weights, *factored_arguments)
+    assert factored_loss == pytest.approx(loss, rel=1e-9)
+    np.testing.assert_allclose(factored_gradient, gradient, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("factored", [False, True])
+def test_gradient(feature_id, history_handler, histories, tmp_path, factored):
+    arguments, factored_arguments = create_arguments(feature_id, history_handler, histories, str(tmp_path))
+    weights = np.random.RandomState(1).normal(0, 0.5, feature_id.number_of_features)
+
+    np.random.seed(2)
+    if factored:
+        error = Optimizer.check_gradient(weights, factored_arguments, objective=Optimizer.factored_objective)
+    else:
+        error = Optimizer.check_gradient(weights, arguments)
+    assert error < 1e-4
+
+
+def test_sharded_objective(feature_id, history_handler, histories, tmp_path):
+    from Project.Train.ShardedObjective import ShardedObjective
+
+    _, factored_arguments = create_arguments(feature_id, history_handler, histories, str(tmp_path))
+    observations, tags, table, number_of_tags, regularization = factored_arguments
+    weights = np.random.RandomState(3).normal(0, 0.5, feature_id.number_of_features)
+
+    loss, gradient = Optimizer.factored_objective(weights, *factored_arguments)
+    with ShardedObjective(observations, tags, table, number_of_tags, len(weights), regularization, 3) as objective:
+        sharded_loss, sharded_gradient = objective(weights)
+    assert sharded_loss == pytest.approx(loss, rel=1e-9)
+    np.testing.assert_allclose(sharded_gradient, gradient, rtol=1e-9, atol=1e-9)
+
+
+def test_sharded_objective_dead_worker(feature_id, history_handler, histories, tmp_path):
+    from Project.Train.ShardedObjective import ShardedObjective
+
+    _, factored_arguments = create_arguments(feature_id, history_handler, histories, str(tmp_path))
+    observations, tags, table, number_of_tags, regularization = factored_arguments
+    objective = ShardedObjective(observations, tags, table, number_of_tags, feature_id.number_of_features,
+                                 regularization, 2)
+    names = [objective.weights_memory.name, objective.gradients_memory.name]
+    objective.workers[0].kill()
+    objective.workers[0].join()
+    objective.close()
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
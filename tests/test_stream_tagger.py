@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+from Project.Inference.StreamTagger import StreamTagger
+
+
+def test_read_sentences(tmp_path):
+    path = tmp_path / "sentences.words"
+    path.write_bytes(b"The dog runs\r\n\r\nA cat\r\n")
+    assert list(StreamTagger.read_sentences(str(path))) == [("The", "dog", "runs"), (), ("A", "cat")]
+
+
+def test_missing_model(tmp_path):
+    input_path = tmp_path / "sentences.words"
+    input_path.write_text("The dog runs\n")
+    tagger = StreamTagger(str(tmp_path / "missing.json"), "Project/Data/dummy.wtag", np.zeros(1), processes=2)
+    with pytest.raises(FileNotFoundError):
+        tagger.tag_file(str(input_path), str(tmp_path / "output.wtag"))
@@ -0,0 +1,38 @@
+import asyncio
+from Project.Inference.TaggingServer import TaggingServer
+
+
+class StubInference:
+    """
+    Tags every word as NN, and fails on an empty word
+    """
+
+    def infer_batch(self, sentences, beam_size=5, factored=True, margin=None):
+        # word[0] raises an IndexError on an empty word (as the capital features do)
+        return [["NN" for word in words if word[0]] for words in sentences]
+
+
+async def _request(port: int, line: bytes) -> str:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(line)
+    await writer.drain()
+    response = await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+    return response.decode().rstrip("\n")
+
+
+def test_failing_request():
+    async def run():
+        server = TaggingServer(StubInference(), max_delay=0.1)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.gather(_request(port, b"The  dog\n"), _request(port, b"The dog runs\r\n"))
+        finally:
+            listener.close()
+            await server.stop()
+
+    failed, tagged = asyncio.run(run())
+    assert failed.startswith("ERROR")
+    assert tagged == "The_NN dog_NN runs_NN"